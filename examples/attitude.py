@@ -240,8 +240,16 @@ def main():
     """Call methods and create pdf with plots showing relevant data."""
     args = parser.parse_args()
     # create dataframe-ulog class for Attitude/Attiutde-setpoint topic
+    # only the fields that are used below are loaded
     att = DfUlg.create(
-        args.filename, topics=["vehicle_attitude", "vehicle_attitude_setpoint"]
+        args.filename,
+        topics=[
+            TopicMsgs("vehicle_attitude", ["q"]),
+            TopicMsgs(
+                "vehicle_attitude_setpoint",
+                ["roll_body", "pitch_body", "yaw_body", "q_d"],
+            ),
+        ],
     )
 
     with PdfPages("attitude.pdf") as pdf:
@@ -0,0 +1,359 @@
+"""Benchmark of the conversion pipeline stages.
+
+Runs each stage of the conversion on the given logs and on synthetic logs of
+the given sizes, measures its time and peak memory and stores the results as
+json. Compared with a baseline, stages that became slower or use more memory
+than the threshold are reported as regressions.
+
+Example:
+python -m pyulgresample.benchmark testlogs/*.ulg --rows 100000 1000000 --topics 5 100 -o results.json --baseline baseline.json
+
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from pyulgresample import loginfo
+from pyulgresample import mathpandas as mpd
+from pyulgresample import ulogconv as conv
+from pyulgresample import ulogsynth
+from pyulgresample.ulogdataframe import TopicMsgs
+
+# stages faster than this are not compared, their timing is mostly noise
+_MIN_TIME_S = 1e-3
+
+
+def synthetic_ulog(rows, topics, seed=0):
+    """Return a synthetic ulog structure, see ulogsynth.generate.
+
+    The topics are sampled at different rates, such that the merged dataframe
+    has about rows rows at 10 kHz. Each topic has an attitude quaternion,
+    three float fields and an integer mode.
+
+    Arguments:
+    rows -- number of rows of the merged dataframe
+    topics -- number of topics
+
+    Keyword arguments:
+    seed -- seed of the random generator (default 0)
+
+    """
+    duration_s = max(rows, topics) / 10000.0
+    # topic i has a share of the samples proportional to 1 / (i + 1)
+    shares = 1.0 / np.arange(1, topics + 1)
+    rates = rows / duration_s * shares / shares.sum()
+    specs = [
+        ulogsynth.TopicSpec("synthetic_{:d}".format(i), rate)
+        for i, rate in enumerate(rates)
+    ]
+    return ulogsynth.generate(specs, duration_s, seed)
+
+
+def _integer_fields(ulog):
+    """Return TopicMsgs of the integer fields, which are held with zoh."""
+    topic_msgs_list = []
+    for msg in ulog.data_list:
+        fields = [
+            field
+            for field, values in msg.data.items()
+            if field != "timestamp" and np.issubdtype(values.dtype, np.integer)
+        ]
+        if fields:
+            topic_msgs_list.append(TopicMsgs(msg.name, fields))
+    return topic_msgs_list
+
+
+def _quaternion_columns(columns):
+    """Return the columns of the first quaternion q_0 ... q_3 or None."""
+    for col in columns:
+        if col.endswith("__F_q_0"):
+            quaternion = [col[:-1] + str(i) for i in range(4)]
+            if all(q in columns for q in quaternion):
+                return quaternion
+    return None
+
+
+def _stages(filepath):
+    """Return a list of (name, setup, run) of the pipeline stages.
+
+    setup returns the argument of run and is not measured. The merge and
+    resample functions rename the columns of the pandadict in place, so
+    each of their runs gets a new pandadict, which does not copy the data.
+
+    """
+    ulog = loginfo.get_ulog(filepath)
+    zoh = _integer_fields(ulog)
+
+    def pandadict():
+        return conv.create_pandadict(ulog)
+
+    merged = conv.merge_pandadict(pandadict())
+    df = conv.merge_pandadict(pandadict(), interpolate=True)
+    timestamps = conv.create_grid(pandadict(), 100)
+    stages = [
+        ("read_ulog", lambda: filepath, loginfo.get_ulog),
+        ("create_pandadict", lambda: ulog, conv.create_pandadict),
+        ("merge_pandadict", pandadict, conv.merge_pandadict),
+        (
+            "apply_zoh",
+            lambda: merged.copy(),
+            lambda m: conv.apply_zoh(m, zoh),
+        ),
+        (
+            "interpolate_pandaframe",
+            lambda: merged.copy(),
+            conv.interpolate_pandaframe,
+        ),
+        (
+            "merge_pandadict_interpolate",
+            pandadict,
+            lambda p: conv.merge_pandadict(
+                p, interpolate=True, zoh_topic_msgs_list=zoh
+            ),
+        ),
+        (
+            "resample_pandadict",
+            pandadict,
+            lambda p: conv.resample_pandadict(p, timestamps, zoh),
+        ),
+    ]
+
+    quaternion = _quaternion_columns(df.columns)
+    if quaternion is not None:
+        q = [df[col] for col in quaternion]
+        stages += [
+            (
+                "series_quat2euler",
+                lambda: q,
+                lambda q: mpd.get_series_quat2euler(*q),
+            ),
+            (
+                "tilt_from_attitude",
+                lambda: q,
+                lambda q: mpd.get_tilt_from_attitude(*q),
+            ),
+        ]
+    return stages
+
+
+def measure(setup, run, repeat=3):
+    """Return the best time in seconds and the peak memory in bytes of run.
+
+    The time is measured without tracing, the memory in an additional run
+    traced with tracemalloc, which covers numpy and pandas allocations.
+
+    Arguments:
+    setup -- function that returns the argument of run
+    run -- function with one argument
+
+    Keyword arguments:
+    repeat -- number of timed runs (default 3)
+
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        times.append(time.perf_counter() - start)
+        del arg
+
+    arg = setup()
+    tracemalloc.start()
+    try:
+        run(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def run_case(filepath, repeat=3):
+    """Return a dictionary of stage name to time and peak memory.
+
+    Arguments:
+    filepath -- path to .ulg file
+
+    Keyword arguments:
+    repeat -- number of timed runs per stage (default 3)
+
+    """
+    results = {}
+    for name, setup, run in _stages(filepath):
+        time_s, peak_bytes = measure(setup, run, repeat)
+        results[name] = {"time_s": time_s, "peak_bytes": peak_bytes}
+    return results
+
+
+def compare(results, baseline, threshold=0.2, memory_threshold=None):
+    """Return the regressions of results compared with a baseline.
+
+    Only stages that exist in both results are compared, stages faster
+    than 1 ms are not compared.
+
+    Returns a list of (case, stage, metric, baseline value, value).
+
+    Arguments:
+    results -- results of run
+    baseline -- results of run for the baseline
+
+    Keyword arguments:
+    threshold -- allowed relative increase of time (default 0.2)
+    memory_threshold -- allowed relative increase of peak memory
+                        (default None: same as threshold)
+
+    """
+    if memory_threshold is None:
+        memory_threshold = threshold
+    limits = {"time_s": 1 + threshold, "peak_bytes": 1 + memory_threshold}
+    regressions = []
+    for case, stages in results["cases"].items():
+        for stage, result in stages.items():
+            base = baseline["cases"].get(case, {}).get(stage)
+            if base is None:
+                continue
+            for metric, limit in limits.items():
+                if metric == "time_s" and result[metric] < _MIN_TIME_S:
+                    continue
+                if result[metric] > base[metric] * limit:
+                    regressions.append(
+                        (case, stage, metric, base[metric], result[metric])
+                    )
+    return regressions
+
+
+def run(logs=(), rows=(), topics=(), repeat=3, max_cells=2e8, report=None):
+    """Run the benchmark on logs and synthetic logs of all sizes.
+
+    The synthetic logs are written into a temporary directory, such that
+    parsing is measured as well. Synthetic cases whose merged dataframe would
+    have more than max_cells values are skipped.
+
+    Returns a json-serializable dictionary with the results per case.
+
+    Keyword arguments:
+    logs -- list of paths to .ulg files (default ())
+    rows -- list of row counts of synthetic logs (default ())
+    topics -- list of topic counts of synthetic logs (default ())
+    repeat -- number of timed runs per stage (default 3)
+    max_cells -- largest synthetic dataframe (default 2e8)
+    report -- function called with the case name and its results (default None)
+
+    """
+    results = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "cases": {},
+    }
+    # synthetic logs are generated when their case is run
+    cases = [(log, log, None) for log in logs]
+    with tempfile.TemporaryDirectory(prefix="pyulgresample_") as tmp:
+        for n in rows:
+            for t in topics:
+                # 8 fields per topic
+                if n * t * 8 > max_cells:
+                    continue
+                name = "synthetic_{:d}rows_{:d}topics".format(int(n), int(t))
+                filepath = os.path.join(tmp, name + ".ulg")
+                cases.append((name, filepath, (int(n), int(t))))
+
+        for name, filepath, size in cases:
+            if size is not None:
+                ulogsynth.write_ulog(filepath, synthetic_ulog(*size))
+            results["cases"][name] = run_case(filepath, repeat)
+            if size is not None:
+                os.remove(filepath)
+            if report is not None:
+                report(name, results["cases"][name])
+    return results
+
+
+def _print_case(name, stages):
+    """Print the results of a case."""
+    print(name)
+    for stage, result in stages.items():
+        print(
+            "  {:30s} {:10.4f} s {:10.1f} MB".format(
+                stage, result["time_s"], result["peak_bytes"] / 1e6
+            )
+        )
+
+
+def main(argv=None):
+    """Run the benchmark from the command line.
+
+    Returns the exit code, 1 if a stage regressed compared with the baseline.
+
+    Keyword arguments:
+    argv -- list of arguments (default None: sys.argv)
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the conversion pipeline stages"
+    )
+    parser.add_argument("logs", nargs="*", help=".ulg files")
+    parser.add_argument(
+        "--rows", nargs="*", type=float, default=[], help="synthetic rows"
+    )
+    parser.add_argument(
+        "--topics", nargs="*", type=int, default=[5], help="synthetic topics"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--max-cells",
+        type=float,
+        default=2e8,
+        help="skip synthetic logs with larger merged dataframes",
+    )
+    parser.add_argument("-o", "--output", help="json file for the results")
+    parser.add_argument("--baseline", help="json file of baseline results")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed relative increase of time",
+    )
+    parser.add_argument(
+        "--memory-threshold",
+        type=float,
+        help="allowed relative increase of peak memory (default: threshold)",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.logs,
+        args.rows,
+        args.topics,
+        args.repeat,
+        args.max_cells,
+        report=_print_case,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(
+        results, baseline, args.threshold, args.memory_threshold
+    )
+    for case, stage, metric, base, value in regressions:
+        print(
+            "Regression {:s} {:s} {:s}: {:g} -> {:g}".format(
+                case, stage, metric, base, value
+            )
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""Command line batch converter of .ulg files into Parquet files.
+
+Example:
+pyulgresample logs/ -o out/ -t vehicle_attitude:q,rollspeed -t vehicle_status --rate-hz 50
+
+Each input file is converted with DfUlg.create and stored with DfUlg.save in
+a process pool. Inputs whose output is newer than the input are skipped.
+Inputs that would be written to the same output are refused.
+
+"""
+import argparse
+import concurrent.futures
+import glob
+import os
+import sys
+import time
+from pyulgresample.ulogdataframe import DfUlg, TopicMsgs
+
+
+def parse_topic(spec):
+    """Parse a topic spec of the form topic or topic:msg1,msg2.
+
+    Returns the topic name or TopicMsgs.
+
+    Arguments:
+    spec -- topic spec
+
+    """
+    topic_msgs = parse_topic_msgs(spec)
+    if not topic_msgs.msgs:
+        return topic_msgs.topic
+    return topic_msgs
+
+
+def parse_topic_msgs(spec):
+    """Parse a topic spec of the form topic or topic:msg1,msg2.
+
+    Returns TopicMsgs, whose msgs are empty for all msgs of the topic.
+
+    Arguments:
+    spec -- topic spec
+
+    """
+    topic, _, msgs = spec.partition(":")
+    return TopicMsgs(topic, msgs.split(",") if msgs else [])
+
+
+def find_inputs(paths):
+    """Return the .ulg files of a list of files, directories and globs.
+
+    Directories are searched recursively. Each file is returned with its
+    path relative to the directory it was found in, or for globs relative
+    to the directory before the first wildcard, i.e. a/x.ulg for
+    logs/*/x.ulg.
+
+    Arguments:
+    paths -- list of files, directories or glob patterns
+
+    """
+    inputs = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in files:
+                    if name.endswith(".ulg"):
+                        filepath = os.path.normpath(os.path.join(root, name))
+                        inputs[filepath] = os.path.relpath(filepath, path)
+            continue
+        root = _glob_root(path)
+        for filepath in glob.glob(path, recursive=True):
+            if filepath.endswith(".ulg") and os.path.isfile(filepath):
+                filepath = os.path.normpath(filepath)
+                inputs[filepath] = os.path.relpath(filepath, root)
+    return sorted(inputs.items())
+
+
+def _glob_root(pattern):
+    """Return the directory of a glob pattern before the first wildcard."""
+    root = os.path.dirname(pattern)
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root or "."
+
+
+def output_path(output, relpath):
+    """Return the Parquet file of an input file."""
+    return os.path.join(output, os.path.splitext(relpath)[0] + ".parquet")
+
+
+def is_up_to_date(filepath, outpath):
+    """Return True if the output exists and is newer than the input."""
+    return os.path.isfile(outpath) and os.path.getmtime(
+        outpath
+    ) >= os.path.getmtime(filepath)
+
+
+def _convert(filepath, outpath, create_kwargs, save_kwargs):
+    """Convert one file in a worker, return the number of rows."""
+    dfulg = DfUlg.create(filepath, **create_kwargs)
+    # write next to the output and rename, a failed run leaves no output
+    tmp = outpath + ".tmp"
+    try:
+        dfulg.save(tmp, **save_kwargs)
+        os.replace(tmp, outpath)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return len(dfulg.df)
+
+
+def _parser():
+    """Return the argument parser."""
+    parser = argparse.ArgumentParser(
+        prog="pyulgresample",
+        description="Convert .ulg files into resampled Parquet files",
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help=".ulg files, directories or globs"
+    )
+    parser.add_argument(
+        "-o", "--output", required=True, help="output directory"
+    )
+    parser.add_argument(
+        "-t",
+        "--topic",
+        action="append",
+        dest="topics",
+        metavar="TOPIC[:MSG,...]",
+        help="topic, optionally with msgs, can be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--zoh",
+        action="append",
+        metavar="TOPIC[:MSG,...]",
+        help="msgs that are resampled with zero-order hold",
+    )
+    parser.add_argument(
+        "--rate-hz",
+        type=float,
+        help="resample at a fixed rate instead of merging all timestamps",
+    )
+    parser.add_argument(
+        "--compact", action="store_true", help="keep the dtypes of the log"
+    )
+    parser.add_argument(
+        "--compression", default="zstd", help="Parquet compression codec"
+    )
+    parser.add_argument(
+        "--row-group-s", type=float, help="seconds of log time per row group"
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, help="number of worker processes"
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="convert files whose output is up to date",
+    )
+    return parser
+
+
+def main(argv=None):
+    """Run the converter.
+
+    Returns the exit code, 1 if a file could not be converted.
+
+    Keyword arguments:
+    argv -- list of arguments (default None: sys.argv)
+
+    """
+    parser = _parser()
+    args = parser.parse_args(argv)
+    create_kwargs = {
+        "topics": [parse_topic(t) for t in args.topics or []] or None,
+        "zoh_topic_msgs_list": [parse_topic_msgs(t) for t in args.zoh or []]
+        or None,
+        "rate_hz": args.rate_hz,
+        "compact": args.compact,
+    }
+    save_kwargs = {
+        "compression": args.compression,
+        "row_group_s": args.row_group_s,
+    }
+
+    outputs = {}
+    for filepath, relpath in find_inputs(args.inputs):
+        outpath = output_path(args.output, relpath)
+        if outpath in outputs:
+            parser.error(
+                "{:s} and {:s} have the same output {:s}".format(
+                    outputs[outpath], filepath, outpath
+                )
+            )
+        outputs[outpath] = filepath
+
+    jobs = []
+    skipped = 0
+    for outpath, filepath in outputs.items():
+        if not args.force and is_up_to_date(filepath, outpath):
+            skipped += 1
+            continue
+        os.makedirs(os.path.dirname(outpath) or ".", exist_ok=True)
+        jobs.append((filepath, outpath))
+
+    start = time.perf_counter()
+    converted = failed = rows = nbytes = 0
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as executor:
+        futures = {
+            executor.submit(
+                _convert, filepath, outpath, create_kwargs, save_kwargs
+            ): filepath
+            for filepath, outpath in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            filepath = futures[future]
+            try:
+                rows += future.result()
+            except Exception as e:
+                failed += 1
+                print("{:s}: {}".format(filepath, e), file=sys.stderr)
+                continue
+            converted += 1
+            nbytes += os.path.getsize(filepath)
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    print(
+        "{:d} converted, {:d} skipped, {:d} failed in {:.2f} s".format(
+            converted, skipped, failed, elapsed
+        )
+    )
+    print(
+        "{:.2f} files/s, {:.2f} MB/s, {:.0f} rows/s".format(
+            converted / elapsed, nbytes / elapsed / 1e6, rows / elapsed
+        )
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
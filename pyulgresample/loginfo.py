@@ -2,23 +2,49 @@
 import pyulog
 import numpy as np
 import datetime
+import mmap
+import os
+import struct
 import warnings
+import weakref
+import pandas as pd
+from pyulgresample import ulogconv as conv
 
 
-def get_ulog(filepath, topics=None):
+def get_ulog(filepath, topics=None, cache=None):
     """Read a ulg file from the given filepath and return it as a ulog structure.
 
     It can be that sometimes, topics are missing.
     Thus, check if the required topic are available in the ulog file.
 
+    Topics can also be given as TopicMsgs. If msgs of a TopicMsgs are provided, only these fields
+    and the timestamp are kept in the ulog structure, see ulogconv.project_ulog.
+
     Arguments:
     filepath -- absoulte path to the .ulg file
-    topics -- list of required topics
+    topics -- list of required topics or TopicMsgs
+    cache -- ULogCache, if provided the parsed topics are loaded from or stored in the cache
 
     """
+    topic_msgs_list = None
     if topics:
-        ulog = pyulog.ULog(filepath, topics)
+        topic_msgs_list = [t for t in topics if hasattr(t, "topic")]
+        topics = [getattr(t, "topic", t) for t in topics]
+
+    ulog = None
+    if cache is not None:
+        ulog = cache.load(filepath, topics)
+
+    if ulog is None:
+        if topics:
+            ulog = pyulog.ULog(filepath, topics)
+        else:
+            ulog = pyulog.ULog(filepath)
+
+        if cache is not None:
+            cache.store(filepath, ulog, topics)
 
+    if topics:
         tmp = topics.copy()
 
         for topic in ulog.data_list:
@@ -30,15 +56,211 @@ def get_ulog(filepath, topics=None):
             warnings.warn(
                 "The following topics do not exist: \n {0}".format(tmp)
             )
-    else:
-        ulog = pyulog.ULog(filepath)
 
     if not ulog.data_list:
         warnings.warn("No topics present.")
 
+    if topic_msgs_list:
+        conv.project_ulog(ulog, topic_msgs_list)
+
     return ulog
 
 
+# types of all ulog messages, used to recognize message boundaries
+_MSG_TYPES = {
+    getattr(pyulog.ULog, name)
+    for name in dir(pyulog.ULog)
+    if name.startswith("MSG_TYPE_")
+}
+_HEADER_SIZE = 16
+# messages at the start of a tail scan that are only used for validation
+_MIN_CHAIN = 4
+
+
+class ULogInfo:
+    """Metadata of a ulog file, read without parsing the data messages.
+
+    Only the header, definitions and initial parameters are parsed with pyulog.
+    The last timestamp is recovered from the data messages at the end of the
+    file. Provides the members of pyulog.ULog that are used by get_starttime,
+    get_duration and get_param. Parameter changes are part of the data section
+    and are not available.
+
+    """
+
+    def __init__(self, filepath, tail_bytes=1 << 16):
+        """Initialization.
+
+        Arguments:
+        filepath -- path to .ulg file
+
+        Keyword arguments:
+        tail_bytes -- number of bytes at the end of the file that are scanned
+                      first for the last timestamp (default 64 KiB)
+
+        """
+        ulog = pyulog.ULog(filepath, parse_header_only=True)
+        self.start_timestamp = ulog.start_timestamp
+        self.initial_parameters = ulog.initial_parameters
+        self.changed_parameters = []
+        self.msg_info_dict = ulog.msg_info_dict
+        self.formats = sorted(ulog.message_formats)
+        self.file_size = os.path.getsize(filepath)
+        with open(filepath, "rb") as f:
+            self.last_timestamp = _scan_last_timestamp(
+                f, self.file_size, self.start_timestamp, tail_bytes
+            )
+
+
+def _message_chain(buf, pos):
+    """Follow the message headers in buf from pos to the end of buf.
+
+    Returns the list of (offset, type, size) of the messages, or None if a
+    header has an unknown type. The last message may be cut.
+
+    """
+    chain = []
+    while pos + 3 <= len(buf):
+        size, msg_type = struct.unpack_from("<HB", buf, pos)
+        if msg_type not in _MSG_TYPES:
+            return None
+        chain.append((pos, msg_type, size))
+        pos += 3 + size
+    return chain
+
+
+def _scan_tail(buf, at_start):
+    """Return the largest timestamp of the data messages in buf.
+
+    The first offset from which the message headers chain up to the end of
+    buf is taken as message boundary. Data messages are expected to start
+    with the timestamp, as all PX4 topics do. Returns None if buf contains no
+    complete data message.
+
+    Arguments:
+    buf -- bytes at the end of the file
+    at_start -- True if buf starts at the first message of the file
+
+    """
+    for pos in range(len(buf)):
+        chain = _message_chain(buf, pos)
+        if chain is None:
+            continue
+        if not at_start or pos > 0:
+            # a false boundary can chain up for a few messages before it
+            # runs into the real message boundaries
+            if len(chain) <= _MIN_CHAIN:
+                continue
+            chain = chain[_MIN_CHAIN:]
+        timestamps = [
+            struct.unpack_from("<Q", buf, offset + 5)[0]
+            for offset, msg_type, size in chain
+            if msg_type == pyulog.ULog.MSG_TYPE_DATA
+            and size >= 10
+            and offset + 3 + size <= len(buf)
+        ]
+        return max(timestamps, default=None)
+    return None
+
+
+def _scan_last_timestamp(f, file_size, start_timestamp, tail_bytes):
+    """Return the largest timestamp of the data messages at the end of a file.
+
+    The scanned tail is doubled until it contains a data message, logs can
+    end with a few kilobytes of info messages.
+
+    Arguments:
+    f -- file object opened for binary reading
+    file_size -- size of the file in bytes
+    start_timestamp -- timestamp of the file header, returned if the file
+                       has no data messages
+    tail_bytes -- number of bytes to scan first
+
+    """
+    while True:
+        begin = max(_HEADER_SIZE, file_size - tail_bytes)
+        f.seek(begin)
+        timestamp = _scan_tail(f.read(), begin == _HEADER_SIZE)
+        if timestamp is not None:
+            return max(timestamp, start_timestamp)
+        if begin == _HEADER_SIZE:
+            return start_timestamp
+        tail_bytes *= 2
+
+
+def get_ulog_info(filepath, tail_bytes=1 << 16):
+    """Read the metadata of a ulg file without parsing the logged data.
+
+    Much faster than get_ulog for logs with many messages, see ULogInfo.
+
+    Arguments:
+    filepath -- path to .ulg file
+
+    Keyword arguments:
+    tail_bytes -- number of bytes at the end of the file that are scanned
+                  first for the last timestamp (default 64 KiB)
+
+    """
+    return ULogInfo(filepath, tail_bytes)
+
+
+def get_message_counts(filepath):
+    """Count the data messages per topic instance of a ulg file.
+
+    Only the message headers and subscriptions are read, the data messages
+    are skipped. The file is memory-mapped, such that only the pages of the
+    message headers are loaded. After a corrupt message header, counting
+    continues at the next sync message.
+
+    Returns a dictionary of (topic, instance) to the number of messages.
+
+    Arguments:
+    filepath -- path to .ulg file
+
+    """
+    with open(filepath, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= _HEADER_SIZE:
+            return {}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _count_messages(buf)
+
+
+def _count_messages(buf):
+    """Count the data messages per topic instance in a ulg buffer."""
+    subscriptions = {}
+    counts = {}
+    pos = _HEADER_SIZE
+    while pos + 3 <= len(buf):
+        size, msg_type = struct.unpack_from("<HB", buf, pos)
+        if msg_type not in _MSG_TYPES:
+            sync = buf.find(pyulog.ULog.SYNC_BYTES, pos + 1)
+            if sync < 0:
+                break
+            if sync - 3 > pos:
+                # continue at the header of the sync message
+                pos = sync - 3
+            else:
+                # the header of the sync message is damaged, skip it
+                pos = sync + len(pyulog.ULog.SYNC_BYTES)
+            continue
+        if pos + 3 + size > len(buf):
+            break
+        if msg_type == pyulog.ULog.MSG_TYPE_DATA:
+            (msg_id,) = struct.unpack_from("<H", buf, pos + 3)
+            if msg_id in subscriptions:
+                key = subscriptions[msg_id]
+                counts[key] = counts.get(key, 0) + 1
+        elif msg_type == pyulog.ULog.MSG_TYPE_ADD_LOGGED_MSG:
+            multi_id, msg_id = struct.unpack_from("<BH", buf, pos + 3)
+            name = buf[pos + 6 : pos + 3 + size].decode(errors="replace")
+            subscriptions[msg_id] = (name, multi_id)
+        elif msg_type == pyulog.ULog.MSG_TYPE_REMOVE_LOGGED_MSG:
+            (msg_id,) = struct.unpack_from("<H", buf, pos + 3)
+            subscriptions.pop(msg_id, None)
+        pos += 3 + size
+    return counts
+
+
 def mu2hms(musecond):
     """convert microsecond to hours:min:second (string)."""
     m1, s1 = divmod(int(musecond / 1e6), 60)
@@ -81,26 +303,180 @@ def get_param(ulog, parameter_name, default):
         return default
 
 
+class ParamTimeline:
+    """Values of the parameters over time, built once per ulog structure.
+
+    The changes of each parameter are stored as sorted arrays of timestamps
+    and values, such that the value at any timestamp is a single lookup.
+
+    """
+
+    def __init__(self, ulog):
+        """Initialization.
+
+        Arguments:
+        ulog -- messages stored in ulog structure
+
+        """
+        self.initial = ulog.initial_parameters
+        changes = {}
+        for time, name, value in ulog.changed_parameters:
+            changes.setdefault(name, []).append((time, value))
+
+        self.changes = {}
+        for name, change in changes.items():
+            times = np.array([time for time, _ in change], dtype=np.int64)
+            # stable sort: of several changes at the same time, the last wins
+            order = np.argsort(times, kind="stable")
+            values = np.array([value for _, value in change])
+            self.changes[name] = (times[order], values[order])
+        self._history = None
+
+    def names(self):
+        """Return the names of all parameters."""
+        return sorted(set(self.initial) | set(self.changes))
+
+    def value_at(self, parameter_name, timestamps, default=0):
+        """Return the value of a parameter at the given timestamps.
+
+        A change applies from its timestamp onwards. Before the first change,
+        the initial value is returned.
+
+        Arguments:
+        parameter_name -- name of the parameter
+        timestamps -- timestamp or array of timestamps in microseconds
+
+        Keyword arguments:
+        default -- value if the parameter is not available (default 0)
+
+        """
+        initial = self.initial.get(parameter_name, default)
+        if parameter_name not in self.changes:
+            if np.ndim(timestamps) == 0:
+                return initial
+            return np.full(np.shape(timestamps), initial)
+
+        times, values = self.changes[parameter_name]
+        values = np.concatenate((np.array([initial]), values))
+        idx = np.searchsorted(times, timestamps, side="right")
+        return values[idx]
+
+    def history(self):
+        """Return the values of all parameters as a dense dataframe.
+
+        There is one row for the initial values and one row per timestamp at
+        which a parameter changed, with a timestamp column and one column per
+        parameter. Each row holds the values from its timestamp until the
+        next row. The dataframe is built on the first call and reused.
+
+        """
+        if self._history is None:
+            times = [np.zeros(1, dtype=np.int64)]
+            times += [t for t, _ in self.changes.values()]
+            timestamps = np.unique(np.concatenate(times))
+            columns = {"timestamp": timestamps}
+            for name in self.names():
+                columns[name] = self.value_at(name, timestamps)
+            self._history = pd.DataFrame(columns)
+        return self._history
+
+    def align(self, timestamps, names=None):
+        """Return the values of the parameters at the given timestamps.
+
+        All parameters are looked up at once from the history dataframe.
+
+        Arguments:
+        timestamps -- array of timestamps in microseconds
+
+        Keyword arguments:
+        names -- list of parameter names (default None: all parameters)
+
+        """
+        history = self.history()
+        if names is not None:
+            missing = [n for n in names if n not in history.columns]
+            if missing:
+                warnings.warn(
+                    "The following parameters do not exist: \n {0}".format(
+                        missing
+                    )
+                )
+                names = [n for n in names if n not in missing]
+            history = history[["timestamp"] + names]
+        rows = np.searchsorted(
+            history["timestamp"].values, timestamps, side="right"
+        )
+        return history.drop(columns="timestamp").take(rows - 1)
+
+
+# ulog structures are not hashable, key by id while the ulog is alive
+_timelines = {}
+
+
+def get_param_timeline(ulog):
+    """Return the ParamTimeline of a ulog structure.
+
+    The timeline is built on the first call and reused afterwards.
+
+    Arguments:
+    ulog -- messages stored in ulog structure
+
+    """
+    timeline = _timelines.get(id(ulog))
+    if timeline is None:
+        timeline = ParamTimeline(ulog)
+        _timelines[id(ulog)] = timeline
+        weakref.finalize(ulog, _timelines.pop, id(ulog), None)
+    return timeline
+
+
+def get_param_history(ulog):
+    """Return the history of all parameters of a ulog structure.
+
+    See ParamTimeline.history, the dataframe is cached per ulog structure.
+
+    Arguments:
+    ulog -- messages stored in ulog structure
+
+    """
+    return get_param_timeline(ulog).history()
+
+
+def align_params(dfUlg, names=None):
+    """Return the parameters aligned to the rows of the dataframe.
+
+    Arguments:
+    dfUlg -- DfUlg of the ulog structure
+
+    Keyword arguments:
+    names -- list of parameter names (default None: all parameters)
+
+    """
+    df = get_param_timeline(dfUlg.ulog).align(
+        np.asarray(dfUlg.df["timestamp"]), names
+    )
+    df.index = dfUlg.df.index
+    return df
+
+
 def add_param(dfUlg, parameter_name):
-    """add a parameter from the ulog structure to the dataframe.
+    """add one or several parameters from the ulog structure to the dataframe.
 
     If parameters have changed, update them in the dataframe.
 
     Arguments:
-    ulog -- messages stored in ulog structure
-    parameter_name -- name of the parameter that should be recovered
-    dataframe -- pandas dataframe which contains all messages of the required topics
+    dfUlg -- DfUlg of the ulog structure
+    parameter_name -- name or list of names of the parameters that should be recovered
 
     """
-    dfUlg.df[parameter_name] = get_param(dfUlg.ulog, parameter_name, 0)
-
-    if len(dfUlg.ulog.changed_parameters) > 0 and (
-        parameter_name in [x[1] for x in dfUlg.ulog.changed_parameters]
-    ):
-        for time, name, value in dfUlg.ulog.changed_parameters:
-            if name == parameter_name:
-                dfUlg.df.loc[
-                    (dfUlg.df.timestamp >= time), parameter_name
-                ] = value
-
-        dfUlg.df[parameter_name].fillna(method="ffill", inplace=True)
+    names = parameter_name
+    if isinstance(names, str):
+        names = [names]
+
+    timeline = get_param_timeline(dfUlg.ulog)
+    timestamps = np.asarray(dfUlg.df["timestamp"])
+    with warnings.catch_warnings():
+        # one block per added column, pandas would warn about fragmentation
+        warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+        for name in names:
+            dfUlg.df[name] = timeline.value_at(name, timestamps)
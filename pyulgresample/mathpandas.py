@@ -1,8 +1,6 @@
 """Pandas series / dataframe manipulation."""
 
 import pandas as pd
-import transforms3d.quaternions as quat
-import transforms3d.taitbryan as tf
 import numpy as np
 import utm
 
@@ -15,9 +13,98 @@ def combine_names(msg_name, new_name):
         return new_name
 
 
+def _as_array(series):
+    """Return the values of a series as contiguous float64 array."""
+    return np.ascontiguousarray(series, dtype=np.float64)
+
+
+def quat2euler(q0, q1, q2, q3):
+    """Convert arrays of quaternions into arrays of euler angles.
+
+    Vectorized version of transforms3d.taitbryan.quat2euler. The quaternion
+    does not need to be normalized.
+
+    Arguments:
+    q0-q3 -- numpy arrays of the quaternion entries (w, x, y, z)
+
+    Returns yaw, pitch, roll as numpy arrays.
+
+    """
+    w, x, y, z = q0, q1, q2, q3
+    nq = w * w + x * x + y * y + z * z
+    # quaternions with (close to) zero norm map to the identity rotation
+    degenerate = nq < np.finfo(np.float64).eps
+    s = 2.0 / np.where(degenerate, 1.0, nq)
+    s[degenerate] = 0.0
+
+    # rotation matrix entries that are required for the euler angles
+    r11 = 1.0 - (y * y + z * z) * s
+    r12 = (x * y - w * z) * s
+    r13 = (x * z + w * y) * s
+    r21 = (x * y + w * z) * s
+    r22 = 1.0 - (x * x + z * z) * s
+    r23 = (y * z - w * x) * s
+    r33 = 1.0 - (x * x + y * y) * s
+
+    cy = np.sqrt(r23 * r23 + r33 * r33)
+    # cos(pitch) close to zero: roll and yaw are not unique, roll is set to 0
+    gimbal = cy <= np.finfo(np.float64).eps * 4
+
+    yaw = np.where(gimbal, np.arctan2(r21, r22), np.arctan2(-r12, r11))
+    pitch = np.arctan2(r13, cy)
+    roll = np.where(gimbal, 0.0, np.arctan2(-r23, r33))
+    return yaw, pitch, roll
+
+
+def quatrot(x, y, z, q0, q1, q2, q3):
+    """Rotate arrays of vectors by arrays of quaternions.
+
+    Vectorized version of transforms3d.quaternions.rotate_vector, which computes
+    q * v * conjugate(q) without normalizing q.
+
+    Arguments:
+    x,y,z -- numpy arrays of the vector to be rotated
+    q0-q3 -- numpy arrays of the quaternion entries (w, x, y, z)
+
+    Returns the rotated vector as numpy array of shape (3, n).
+
+    """
+    w = q0
+    # q * v * q' = (w^2 - u.u) v + 2 (u.v) u + 2 w (u x v) with u = (q1, q2, q3)
+    a = w * w - (q1 * q1 + q2 * q2 + q3 * q3)
+    b = 2.0 * (q1 * x + q2 * y + q3 * z)
+    c = 2.0 * w
+    vec = np.empty((3, x.shape[0]))
+    vec[0] = a * x + b * q1 + c * (q2 * z - q3 * y)
+    vec[1] = a * y + b * q2 + c * (q3 * x - q1 * z)
+    vec[2] = a * z + b * q3 + c * (q1 * y - q2 * x)
+    return vec
+
+
+def z_axis_from_quat(q0, q1, q2, q3):
+    """Rotate the unit z axis by arrays of quaternions.
+
+    Same as quatrot applied to (0, 0, 1), without allocating the constant axis.
+
+    Arguments:
+    q0-q3 -- numpy arrays of the quaternion entries (w, x, y, z)
+
+    Returns the rotated z axis as numpy array of shape (3, n).
+
+    """
+    axis = np.empty((3, q0.shape[0]))
+    axis[0] = 2.0 * (q1 * q3 + q0 * q2)
+    axis[1] = 2.0 * (q2 * q3 - q0 * q1)
+    axis[2] = q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3
+    return axis
+
+
 def get_series_quat2euler(q0, q1, q2, q3, msg_name=""):
     """Given pandas series q0-q4, compute series roll, pitch, yaw.
 
+    The euler angles follow the z-y-x (yaw-pitch-roll) convention and are
+    computed for all samples at once.
+
     Arguments:
     q0-q4 -- quaternion entries
 
@@ -25,12 +112,9 @@ def get_series_quat2euler(q0, q1, q2, q3, msg_name=""):
     msg_name -- name of the message for which the euler angles should be computed (default "")
 
     """
-    yaw, pitch, roll = np.array(
-        [
-            tf.quat2euler([q0i, q1i, q2i, q3i])
-            for q0i, q1i, q2i, q3i in zip(q0, q1, q2, q3)
-        ]
-    ).T
+    yaw, pitch, roll = quat2euler(
+        _as_array(q0), _as_array(q1), _as_array(q2), _as_array(q3)
+    )
 
     yaw = pd.Series(
         name=combine_names(msg_name, "yaw"), data=yaw, index=q0.index
@@ -65,20 +149,23 @@ def get_series_quatrot(x, y, z, q0, q1, q2, q3, msg_name=""):
     rot_name -- name of the rotation
 
     """
-    vec = np.array(
-        [
-            quat.rotate_vector([xi, yi, zi], [q0i, q1i, q2i, q3i])
-            for xi, yi, zi, q0i, q1i, q2i, q3i in zip(x, y, z, q0, q1, q2, q3)
-        ]
+    vec = quatrot(
+        _as_array(x),
+        _as_array(y),
+        _as_array(z),
+        _as_array(q0),
+        _as_array(q1),
+        _as_array(q2),
+        _as_array(q3),
     )
     x_r = pd.Series(
-        name=combine_names(msg_name, "x"), data=vec[:, 0], index=x.index
+        name=combine_names(msg_name, "x"), data=vec[0], index=x.index
     )
     y_r = pd.Series(
-        name=combine_names(msg_name, "y"), data=vec[:, 1], index=y.index
+        name=combine_names(msg_name, "y"), data=vec[1], index=y.index
     )
     z_r = pd.Series(
-        name=combine_names(msg_name, "z"), data=vec[:, 2], index=z.index
+        name=combine_names(msg_name, "z"), data=vec[2], index=z.index
     )
     return x_r, y_r, z_r
 
@@ -108,11 +195,10 @@ def get_series_dot(x0, y0, z0, x1, y1, z1, msg_name=""):
     dotname -- name of the newly created data (default "")
 
     """
-    dot = np.array(
-        [
-            np.dot([x0i, y0i, z0i], [x1i, y1i, z1i])
-            for x0i, y0i, z0i, x1i, y1i, z1i in zip(x0, y0, z0, x1, y1, z1)
-        ]
+    dot = (
+        _as_array(x0) * _as_array(x1)
+        + _as_array(y0) * _as_array(y1)
+        + _as_array(z0) * _as_array(z1)
     )
     return pd.Series(
         name=combine_names(msg_name, "dot"), data=dot, index=x0.index
@@ -129,17 +215,45 @@ def get_series_norm_2d(x0, y0, msg_name=""):
     Keyword Arguments:
     dotname -- name of the newly created data (default "")
     """
-    norm = np.array(
-        [np.linalg.norm([x0i, y0i], axis=0) for x0i, y0i in zip(x0, y0)]
-    )
+    norm = np.hypot(_as_array(x0), _as_array(y0))
     return pd.Series(
         name=combine_names(msg_name, "norm"), data=norm, index=x0.index
     )
 
 
+def utm_zone_number(lat, lon):
+    """Compute the UTM zone number for arrays of lat/lon in degrees.
+
+    Vectorized version of utm.latlon_to_zone_number, including the special
+    zones of Norway and Svalbard.
+
+    Arguments:
+    lat -- numpy array of latitudes
+    lon -- numpy array of longitudes
+
+    """
+    # normalize longitude to be in the range [-180, 180)
+    lon = (lon % 360 + 540) % 360 - 180
+    zone = np.floor((lon + 180) / 6) + 1
+
+    norway = (lat >= 56) & (lat < 64) & (lon >= 3) & (lon < 12)
+    zone[norway] = 32
+
+    svalbard = (lat >= 72) & (lat <= 84) & (lon >= 0) & (lon < 42)
+    zone[svalbard & (lon < 9)] = 31
+    zone[svalbard & (lon >= 9) & (lon < 21)] = 33
+    zone[svalbard & (lon >= 21) & (lon < 33)] = 35
+    zone[svalbard & (lon >= 33)] = 37
+    return zone
+
+
 def get_series_utm(lat, lon, msg_name=""):
     """Given pandas series lat/lon in degrees, compute UTM easting/northing/zone.
 
+    The zone is computed for every sample, but the conversion itself is done
+    once per contiguous run of samples within the same zone and hemisphere.
+    Samples with NaN latitude or longitude result in NaN.
+
     Arguments:
     lat -- latitude
     lon -- longitude
@@ -148,24 +262,40 @@ def get_series_utm(lat, lon, msg_name=""):
     msg_name -- name of the newly created data (default "")
 
     """
-    easting, northing, zone, letter = np.array(
-        [utm.from_latlon(lati, loni) for lati, loni in zip(lat, lon)]
-    ).T
+    lat_a = _as_array(lat)
+    lon_a = _as_array(lon)
+
+    easting = np.full(lat_a.shape, np.nan)
+    northing = np.full(lat_a.shape, np.nan)
+    zone = np.full(lat_a.shape, np.nan)
+
+    valid = np.flatnonzero(np.isfinite(lat_a) & np.isfinite(lon_a))
+    zone[valid] = utm_zone_number(lat_a[valid], lon_a[valid])
+
+    # a new run starts whenever the zone or the hemisphere changes
+    key = zone[valid] * 2 + (lat_a[valid] < 0)
+    run_starts = np.flatnonzero(np.diff(key)) + 1
+    for run in np.split(valid, run_starts):
+        if run.size == 0:
+            continue
+        lat_run = lat_a[run]
+        easting[run], northing[run], _, _ = utm.from_latlon(
+            lat_run,
+            lon_a[run],
+            force_zone_number=int(zone[run[0]]),
+            force_zone_letter=utm.latitude_to_zone_letter(lat_run[0]),
+        )
 
     easting = pd.Series(
-        name=combine_names(msg_name, "easting"),
-        data=easting.astype(np.float),
-        index=lat.index,
+        name=combine_names(msg_name, "easting"), data=easting, index=lat.index
     )
     northing = pd.Series(
         name=combine_names(msg_name, "northing"),
-        data=northing.astype(np.float),
+        data=northing,
         index=lat.index,
     )
     zone = pd.Series(
-        name=combine_names(msg_name, "zone"),
-        data=zone.astype(np.float),
-        index=lat.index,
+        name=combine_names(msg_name, "zone"), data=zone, index=lat.index
     )
     return easting, northing, zone
 
@@ -183,23 +313,12 @@ def get_z_axis_from_attitude(q0, q1, q2, q3, msg_name=""):
     msg_name -- name of the newly created data (default "")
 
     """
-    x = pd.Series(
-        np.zeros(q0.shape[0]),
-        index=q0.index,
-        name=combine_names(msg_name, "z_axis_x"),
-    )
-    y = pd.Series(
-        np.zeros(q0.shape[0]),
-        index=q0.index,
-        name=combine_names(msg_name, "z_axis_y"),
-    )
-    z = pd.Series(
-        np.ones(q0.shape[0]),
-        index=q0.index,
-        name=combine_names(msg_name, "z_axis_z"),
+    x, y, z = z_axis_from_quat(
+        _as_array(q0), _as_array(q1), _as_array(q2), _as_array(q3)
     )
-
-    x, y, z = get_series_quatrot(x, y, z, q0, q1, q2, q3)
+    x = pd.Series(x, index=q0.index, name=combine_names(msg_name, "z_axis_x"))
+    y = pd.Series(y, index=q0.index, name=combine_names(msg_name, "z_axis_y"))
+    z = pd.Series(z, index=q0.index, name=combine_names(msg_name, "z_axis_z"))
     return x, y, z
 
 
@@ -216,17 +335,16 @@ def get_tilt_from_attitude(q0, q1, q2, q3, msg_name=""):
     msg_name -- name of the newly created data (default "")
 
     """
-    z_x, z_y, z_z = get_z_axis_from_attitude(q0, q1, q2, q3)
-
-    x = pd.Series(np.zeros(q0.shape[0]), index=q0.index, name="x")
-    y = pd.Series(np.zeros(q0.shape[0]), index=q0.index, name="y")
-    z = pd.Series(np.ones(q0.shape[0]), index=q0.index, name="z")
-
-    tilt = get_series_dot(x, y, z, z_x, z_y, z_z, msg_name)
-    tilt.where(
-        tilt < 1, 1, inplace=True
-    )  # ensure that angle 1 is never exceeded
-    return tilt.apply(np.arccos)
+    # the dot product between the world z axis (0, 0, 1) and the body z axis
+    # is the z component of the body z axis
+    z_z = z_axis_from_quat(
+        _as_array(q0), _as_array(q1), _as_array(q2), _as_array(q3)
+    )[2]
+    # ensure that angle 1 is never exceeded
+    tilt = np.arccos(np.minimum(z_z, 1.0))
+    return pd.Series(
+        name=combine_names(msg_name, "dot"), data=tilt, index=q0.index
+    )
 
 
 def get_normalize_2d_vector(x, y, msg_name=""):
@@ -254,12 +372,19 @@ def get_heading_from_2d_vector(north, east, msg_name=""):
     0 Heading = north is only true if north/east is aligned with GPS coordinate system.
 
     Arguments:
-    x -- pandas time series x component of vector
-    y -- pandas time series y component of vector
+    north -- pandas time series north component of vector
+    east -- pandas time series east component of vector
 
     Keyworkd Arguments:
     msg_name -- name of the newly created data (default "")
 
     """
-    x_n, y_n = get_normalize_2d_vector(north, east, msg_name)
-    return np.sign(y_n) * angle_wrap_pi(np.arccos(x_n))
+    n = _as_array(north)
+    e = _as_array(east)
+    norm = np.maximum(np.hypot(n, e), np.finfo(np.float64).eps)
+    heading = np.sign(e) * angle_wrap_pi(np.arccos(n / norm))
+    return pd.Series(
+        name=combine_names(msg_name, "heading"),
+        data=heading,
+        index=north.index,
+    )
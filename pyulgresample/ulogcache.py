@@ -0,0 +1,412 @@
+"""On-disk cache of parsed ulog topics.
+
+Each cache entry stores the topic arrays of one .ulg file in a single
+columnar file, which is memory-mapped on load, and the log metadata in a
+json file. Entries are keyed by the content hash of the .ulg file and the
+list of requested topics. The least recently used entries are evicted once
+the cache exceeds its size limit.
+
+The same file layout is used by save_ulog/load_ulog and save_frame/load_frame
+to move ulog structures and dataframes between processes without pickling.
+
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from pyulgresample import ulogconv as conv
+
+_META_FILE = "meta.json"
+_DATA_FILE = "columns.bin"
+_ALIGNMENT = 64
+
+
+class CachedData:
+    """Store the data of a single topic instance, like pyulog.ULog.Data."""
+
+    def __init__(self, name, multi_id, data):
+        """Initialization.
+
+        Arguments:
+        name -- topic name
+        multi_id -- topic instance
+        data -- dictionary of field name to numpy array
+
+        """
+        self.name = name
+        self.multi_id = multi_id
+        self.data = data
+
+
+class CachedULog:
+    """Ulog structure restored from the cache.
+
+    Provides the members of pyulog.ULog that are used within this package.
+
+    """
+
+    def __init__(self, meta, data_list):
+        """Initialization.
+
+        Arguments:
+        meta -- dictionary with the log metadata
+        data_list -- list of CachedData
+
+        """
+        self.start_timestamp = meta["start_timestamp"]
+        self.last_timestamp = meta["last_timestamp"]
+        self.initial_parameters = meta["initial_parameters"]
+        self.changed_parameters = [
+            tuple(change) for change in meta["changed_parameters"]
+        ]
+        self.msg_info_dict = meta["msg_info_dict"]
+        self.data_list = data_list
+
+    def get_dataset(self, name, multi_instance=0):
+        """Get a specific topic instance.
+
+        Arguments:
+        name -- topic name
+        multi_instance -- topic instance (default 0)
+
+        """
+        for data in self.data_list:
+            if data.name == name and data.multi_id == multi_instance:
+                return data
+        raise ValueError("Topic {:s} not found".format(name))
+
+
+def hash_file(filepath, block_size=1 << 20):
+    """Compute the sha1 hash of the file content.
+
+    Arguments:
+    filepath -- path to the file
+
+    """
+    sha1 = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _to_python(value):
+    """Convert numpy scalars to python types for json."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _write_columns(f, data, offset):
+    """Write arrays contiguously into a file.
+
+    Arguments:
+    f -- file object opened for binary writing
+    data -- dictionary of column name to numpy array
+    offset -- current position in the file
+
+    Returns the list of [name, dtype, offset, size] of the columns and the new offset.
+
+    """
+    fields = []
+    for name, values in data.items():
+        values = np.ascontiguousarray(values)
+        if values.dtype.hasobject:
+            raise Exception("Column {:s} is not numeric".format(name))
+        padding = -offset % _ALIGNMENT
+        f.write(b"\0" * padding)
+        offset += padding
+        f.write(values.tobytes())
+        fields.append([name, values.dtype.str, offset, values.shape[0]])
+        offset += values.nbytes
+    return fields, offset
+
+
+def _read_columns(buf, fields):
+    """Return a dictionary of column name to array view into buf.
+
+    Arguments:
+    buf -- memory-mapped file
+    fields -- list of [name, dtype, offset, size] from _write_columns
+
+    """
+    data = {}
+    for name, dtype, offset, size in fields:
+        dtype = np.dtype(dtype)
+        if size == 0:
+            data[name] = np.empty(0, dtype=dtype)
+            continue
+        data[name] = buf[offset : offset + size * dtype.itemsize].view(dtype)
+    return data
+
+
+def _save(directory, meta, columns):
+    """Write meta.json and columns.bin into directory.
+
+    Arguments:
+    directory -- existing directory
+    meta -- dictionary of metadata, the column layout is added to it
+    columns -- list of dictionaries of column name to numpy array
+
+    """
+    offset = 0
+    meta["columns"] = []
+    with open(os.path.join(directory, _DATA_FILE), "wb") as f:
+        for data in columns:
+            fields, offset = _write_columns(f, data, offset)
+            meta["columns"].append(fields)
+    with open(os.path.join(directory, _META_FILE), "w") as f:
+        json.dump(meta, f, default=str)
+
+
+def _load(directory):
+    """Read meta.json and memory-map columns.bin from directory.
+
+    Returns the metadata and a list of dictionaries of column name to array.
+
+    Arguments:
+    directory -- directory written by _save
+
+    """
+    with open(os.path.join(directory, _META_FILE)) as f:
+        meta = json.load(f)
+
+    data_path = os.path.join(directory, _DATA_FILE)
+    buf = None
+    if os.path.getsize(data_path) > 0:
+        buf = np.memmap(data_path, dtype=np.uint8, mode="c")
+    return meta, [_read_columns(buf, fields) for fields in meta["columns"]]
+
+
+def ulog_meta(ulog):
+    """Return the metadata of a ulog structure as json-serializable dictionary.
+
+    CachedULog(ulog_meta(ulog), data_list) restores the metadata.
+
+    Arguments:
+    ulog -- ulog structure
+
+    """
+    return {
+        "start_timestamp": int(ulog.start_timestamp),
+        "last_timestamp": int(ulog.last_timestamp),
+        "initial_parameters": {
+            k: _to_python(v) for k, v in ulog.initial_parameters.items()
+        },
+        "changed_parameters": [
+            [_to_python(x) for x in change]
+            for change in ulog.changed_parameters
+        ],
+        "msg_info_dict": {
+            k: _to_python(v) for k, v in ulog.msg_info_dict.items()
+        },
+    }
+
+
+def save_ulog(directory, ulog):
+    """Store the topics and metadata of a ulog structure in a directory.
+
+    Arguments:
+    directory -- existing directory
+    ulog -- ulog structure
+
+    """
+    meta = ulog_meta(ulog)
+    meta["topics"] = [[msg.name, msg.multi_id] for msg in ulog.data_list]
+    _save(directory, meta, [msg.data for msg in ulog.data_list])
+
+
+def load_ulog(directory):
+    """Load a ulog structure stored with save_ulog.
+
+    The topic arrays are memory-mapped copy-on-write, changing them does not
+    change the stored files.
+
+    Arguments:
+    directory -- directory written by save_ulog
+
+    """
+    meta, columns = _load(directory)
+    data_list = [
+        CachedData(name, multi_id, data)
+        for (name, multi_id), data in zip(meta["topics"], columns)
+    ]
+    return CachedULog(meta, data_list)
+
+
+def save_frame(directory, df):
+    """Store the columns of a numeric dataframe in a directory.
+
+    Columns with pandas nullable dtypes are stored as values and mask.
+
+    Arguments:
+    directory -- existing directory
+    df -- dataframe with a timestamp column
+
+    """
+    data = {}
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        if pd.api.types.is_extension_array_dtype(series.dtype):
+            data[str(i)] = series.to_numpy(
+                dtype=series.dtype.numpy_dtype, na_value=0
+            )
+            data[str(i) + "_mask"] = series.isna().values
+        else:
+            data[str(i)] = series.values
+    _save(directory, {"names": list(df.columns)}, [data])
+
+
+def load_frame(directory):
+    """Load a dataframe stored with save_frame without copying its columns.
+
+    Arguments:
+    directory -- directory written by save_frame
+
+    """
+    meta, columns = _load(directory)
+    data = columns[0]
+    arrays = {}
+    for i, name in enumerate(meta["names"]):
+        arrays[name] = data[str(i)]
+        if str(i) + "_mask" in data:
+            arrays[name] = conv.nullable_array(
+                data[str(i)], data[str(i) + "_mask"]
+            )
+    df = pd.DataFrame(arrays, columns=meta["names"], copy=False)
+    df.index = pd.TimedeltaIndex(
+        df["timestamp"].values.astype(np.int64) * 1000
+    )
+    return df
+
+
+class ULogCache:
+    """Cache of parsed ulog topics in a directory."""
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        """Initialization.
+
+        Arguments:
+        directory -- directory of the cache, created if it does not exist,
+                     ~ is expanded to the home directory
+
+        Keyword arguments:
+        max_bytes -- size limit of the cache in bytes (default 1 GiB)
+
+        """
+        directory = os.path.expanduser(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._hashes = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _file_hash(self, filepath):
+        """Return the content hash, rehash only if size or mtime changed."""
+        stat = os.stat(filepath)
+        key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+        if key not in self._hashes:
+            self._hashes[key] = hash_file(filepath)
+        return self._hashes[key]
+
+    def key(self, filepath, topics=None):
+        """Return the cache key of a file and a list of topics.
+
+        Arguments:
+        filepath -- path to .ulg file
+
+        Keyword arguments:
+        topics -- list of topics (default None: all topics)
+
+        """
+        topic_key = "all"
+        if topics:
+            topic_key = hashlib.sha1(
+                "\n".join(sorted(set(topics))).encode()
+            ).hexdigest()[:16]
+        return "{:s}_{:s}".format(self._file_hash(filepath), topic_key)
+
+    def load(self, filepath, topics=None):
+        """Load a ulog structure from the cache.
+
+        Returns None if the file is not cached. The topic arrays are
+        memory-mapped copy-on-write, changing them does not change the cache.
+
+        Arguments:
+        filepath -- path to .ulg file
+
+        Keyword arguments:
+        topics -- list of topics (default None: all topics)
+
+        """
+        entry = os.path.join(self.directory, self.key(filepath, topics))
+        meta_path = os.path.join(entry, _META_FILE)
+        if not os.path.isfile(meta_path):
+            return None
+
+        # mark entry as recently used
+        os.utime(meta_path)
+        return load_ulog(entry)
+
+    def store(self, filepath, ulog, topics=None):
+        """Store a ulog structure in the cache.
+
+        Arguments:
+        filepath -- path to .ulg file
+        ulog -- ulog structure of the file
+
+        Keyword arguments:
+        topics -- list of topics that were used to read ulog (default None)
+
+        """
+        entry = os.path.join(self.directory, self.key(filepath, topics))
+        if os.path.isdir(entry):
+            return
+
+        # write into a temporary directory, then move it in place
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix=".tmp_")
+        try:
+            save_ulog(tmp, ulog)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(entry):
+                raise
+
+        self.evict()
+
+    def entries(self):
+        """Return a list of (last access time, size in bytes, path) of all entries."""
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            meta_path = os.path.join(entry, _META_FILE)
+            if name.startswith(".") or not os.path.isfile(meta_path):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(entry, f))
+                for f in os.listdir(entry)
+            )
+            entries.append((os.path.getmtime(meta_path), size, entry))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the size limit is met.
+
+        The most recently used entry is always kept.
+
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove all entries."""
+        for _, _, entry in self.entries():
+            shutil.rmtree(entry, ignore_errors=True)
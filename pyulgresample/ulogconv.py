@@ -3,9 +3,224 @@ import pyulog
 import pandas as pd
 import re
 import numpy as np
+import concurrent.futures
+import warnings
 
+# column replacement
+_COL_RENAME = {"[": "_", "]": "", ".": "_"}
+_COL_RENAME_PATTERN = re.compile(
+    r"(" + "|".join([re.escape(key) for key in _COL_RENAME.keys()]) + r")"
+)
+_COLUMN_PATTERN = re.compile(r"^T_(.+)_(\d+)__F_(.+)$")
+_ARRAY_FIELD_PATTERN = re.compile(r"^(.+)_\d+$")
 
-def create_pandadict(ULog):
+
+def _rename_field(name):
+    """Replace vector indices and nested fields of a ulog field name."""
+    return _COL_RENAME_PATTERN.sub(lambda x: _COL_RENAME[x.group()], name)
+
+
+def _map(func, items, workers=None):
+    """Apply func to all items, concurrently in a thread pool if workers > 1.
+
+    The numpy routines used per topic release the GIL, such that topics are
+    processed in parallel. Results are returned in the order of items.
+
+    Arguments:
+    func -- function with one argument
+    items -- iterable of arguments
+
+    Keyword arguments:
+    workers -- number of threads (default None: serial)
+
+    """
+    if not workers or workers <= 1:
+        return [func(item) for item in items]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(func, items))
+
+
+class ColumnIndex:
+    """Map topic, instance and field of merged column names to column positions.
+
+    The index is built once from the column names of a merged dataframe,
+    i.e. T_vehicle_attitude_0__F_q_0 -> ("vehicle_attitude", 0, "q_0").
+    Lookups are dictionary lookups and do not scan the columns.
+
+    """
+
+    def __init__(self, columns):
+        """Initialization.
+
+        Arguments:
+        columns -- column names of the form T_topic_instance__F_field
+
+        """
+        self.columns = columns
+        self._fields = {}  # (topic, instance, field) -> position
+        self._arrays = {}  # (topic, instance, array name) -> positions
+        self._topics = {}  # topic -> instance -> positions
+        for pos, col in enumerate(columns):
+            match = _COLUMN_PATTERN.match(col)
+            if not match:
+                continue
+            topic, instance, field = (
+                match.group(1),
+                int(match.group(2)),
+                match.group(3),
+            )
+            self._topics.setdefault(topic, {}).setdefault(instance, []).append(
+                pos
+            )
+            self._fields[(topic, instance, field)] = pos
+            array = _ARRAY_FIELD_PATTERN.match(field)
+            if array:
+                self._arrays.setdefault(
+                    (topic, instance, array.group(1)), []
+                ).append(pos)
+
+    def instances(self, topic):
+        """Return the sorted instances of a topic.
+
+        Arguments:
+        topic -- topic name, i.e. vehicle_attitude
+
+        """
+        return sorted(self._topics.get(topic, {}))
+
+    def groups(self):
+        """Return the column positions grouped by topic instance."""
+        return [
+            positions
+            for instances in self._topics.values()
+            for positions in instances.values()
+        ]
+
+    def positions(self, topic, msgs=None, instance=None):
+        """Return the column positions of a topic.
+
+        A msg is either a ulog field name, i.e. q[0], or the renamed field,
+        i.e. q_0. The name of an array, i.e. q, selects all its elements.
+
+        Arguments:
+        topic -- topic name, i.e. vehicle_attitude
+
+        Keyword arguments:
+        msgs -- list of msgs (default None: all fields of the topic)
+        instance -- topic instance (default None: all instances)
+
+        """
+        instances = self._topics.get(topic, {})
+        if instance is not None:
+            instances = {instance: instances.get(instance, [])}
+
+        positions = []
+        for inst, topic_positions in instances.items():
+            if not msgs:
+                positions.extend(topic_positions)
+                continue
+            for msg in msgs:
+                key = (topic, inst, _rename_field(msg))
+                if key in self._fields:
+                    positions.append(self._fields[key])
+                else:
+                    positions.extend(self._arrays.get(key, []))
+        return positions
+
+    def fields(self):
+        """Return a dictionary of column name to (topic, instance, field)."""
+        return {self.columns[pos]: key for key, pos in self._fields.items()}
+
+    def names(self, topic, msgs=None, instance=None):
+        """Return the column names of a topic.
+
+        Same arguments as positions.
+
+        """
+        return [
+            self.columns[pos] for pos in self.positions(topic, msgs, instance)
+        ]
+
+
+def select_fields(fields, msgs):
+    """Return the fields that are selected by a list of msgs.
+
+    A msg is either a ulog field name, i.e. q[0], or the renamed field,
+    i.e. q_0. The name of an array, i.e. q, selects all its elements.
+
+    Arguments:
+    fields -- ulog field names
+    msgs -- list of msgs
+
+    """
+    wanted = {_rename_field(msg) for msg in msgs}
+    selected = []
+    for field in fields:
+        name = _rename_field(field)
+        array = _ARRAY_FIELD_PATTERN.match(name)
+        if name in wanted or (array and array.group(1) in wanted):
+            selected.append(field)
+    return selected
+
+
+def project_ulog(ulog, topic_msgs_list):
+    """Keep only the msgs of the given topics in the ulog structure.
+
+    Topics without TopicMsgs or with empty msgs keep all fields, the
+    timestamp field is always kept. Only the dictionaries of field arrays
+    are replaced, the arrays are not copied.
+
+    Arguments:
+    ulog -- ulog structure
+    topic_msgs_list -- list of TopicMsgs
+
+    """
+    msgs = {}
+    for topic_msgs in topic_msgs_list:
+        if topic_msgs.msgs:
+            msgs.setdefault(topic_msgs.topic, []).extend(topic_msgs.msgs)
+
+    for msg in ulog.data_list:
+        if msg.name not in msgs:
+            continue
+        fields = set(select_fields(msg.data.keys(), msgs[msg.name]))
+        missing = [
+            m
+            for m in msgs[msg.name]
+            if not select_fields(msg.data.keys(), [m])
+        ]
+        if missing:
+            warnings.warn(
+                "The following msgs of {0} do not exist: \n {1}".format(
+                    msg.name, missing
+                )
+            )
+        msg.data = {
+            field: values
+            for field, values in msg.data.items()
+            if field == "timestamp" or field in fields
+        }
+
+
+def _create_topic_frame(msg):
+    """Convert the data of one topic instance into a dataframe.
+
+    The dataframe wraps the arrays of the ulog without copying them, which
+    pandas does for a dictionary of arrays from version 1.5.3 on.
+
+    """
+    msg_data = pd.DataFrame(msg.data, copy=False)
+    msg_data.columns = [
+        col if col == "timestamp" else "F_" + _rename_field(col)
+        for col in msg_data.columns
+    ]
+    msg_data.index = pd.TimedeltaIndex(
+        msg.data["timestamp"].astype(np.int64) * 1000
+    )
+    return msg_data
+
+
+def create_pandadict(ULog, workers=None):
     """Convert ulog to dictionary of topic based panda-dataframes.
 
     Rename topic-name such that each topic starts with `T_` and ends with instance ID.
@@ -14,113 +229,1046 @@ def create_pandadict(ULog):
     with letter F for denoting fields
     i.e.: fieldmsg[0] -> F_fieldmsg_0; fieldmsg[1] -> F_fieldmsg_1
 
+    The dataframes wrap the field arrays of the ulog object without copying them.
+    Changing values of the dataframes therefore changes the ulog object.
+
     Arguments:
     ULog -- ulog object
 
+    Keyword arguments:
+    workers -- number of threads to convert topics concurrently (default None)
+
     """
-    # column replacement
-    col_rename = {"[": "_", "]": "", ".": "_"}
-    col_rename_pattern = re.compile(
-        r"(" + "|".join([re.escape(key) for key in col_rename.keys()]) + r")"
-    )
+    frames = _map(_create_topic_frame, ULog.data_list, workers)
 
     pandadict = {}
-    for msg in ULog.data_list:
-        msg_data = pd.DataFrame.from_dict(msg.data)
-        msg_data.columns = [
-            col_rename_pattern.sub(lambda x: col_rename[x.group()], col)
-            for col in msg_data.columns
-        ]
-
-        ncol = {}
-        for col in msg_data.columns:
-            if col == "timestamp":
-                ncol[col] = col
-            else:
-                ncol[col] = "F_" + col
-        msg_data.rename(columns=ncol, inplace=True)
-        msg_data.index = pd.TimedeltaIndex(
-            msg_data["timestamp"] * 1e3, unit="ns"
-        )
+    for msg, msg_data in zip(ULog.data_list, frames):
         pandadict["T_{:s}_{:d}".format(msg.name, msg.multi_id)] = msg_data
 
     return pandadict
 
 
-def replace_nan_with_inf(ulog, topic_msgs_list):
+def replace_nan_with_inf(ulog, topic_msgs_list, workers=None):
     """Replace nan-values with inf-values.
 
     Arguments:
     pandadict -- a dictionary of pandas dataframe with keys equal to topics
     topic_msgs_list -- list of topicMsgs on which zero-order-hold interpolation is used
 
+    Keyword arguments:
+    workers -- number of threads to process topics concurrently (default None)
+
     """
+    arrays = {}
     for topic_msgs in topic_msgs_list:
         for ulogtopic in ulog.data_list:
             if ulogtopic.name == topic_msgs.topic:
-                if topic_msgs.msgs:
-                    for msg in topic_msgs.msgs:
-                        nan_ind = np.isnan(ulogtopic.data[msg])
-                        ulogtopic.data[msg][nan_ind] = np.inf
-                else:
-                    for msg in ulogtopic.data.keys():
-                        nan_ind = np.isnan(ulogtopic.data[msg])
-                        ulogtopic.data[msg][nan_ind] = np.inf
+                msgs = topic_msgs.msgs or ulogtopic.data.keys()
+                for msg in msgs:
+                    arrays[id(ulogtopic.data[msg])] = ulogtopic.data[msg]
+
+    def replace(values):
+        nan_ind = np.isnan(values)
+        values[nan_ind] = np.inf
+
+    _map(replace, arrays.values(), workers)
+
+
+def _sample_rows(union, ts):
+    """Return the rows of the samples within the union of timestamps.
+
+    If a timestamp occurs more than once, only the last sample is kept.
+
+    Returns the rows and the indices of the kept samples.
+
+    Arguments:
+    union -- sorted unique timestamps
+    ts -- sorted sample timestamps
+
+    """
+    rows = np.searchsorted(union, ts)
+    keep = rows[1:] != rows[:-1]
+    if keep.all():
+        return rows, slice(None)
+    keep = np.flatnonzero(np.append(keep, True))
+    return rows[keep], keep
 
 
-def merge_pandadict(pandadict):
+class _GapFill:
+    """Fill the rows of a merged topic which have no sample of the topic.
+
+    The positions of the neighbouring samples are computed once per topic
+    from its sample rows, each column is then filled in one vectorized pass.
+    Only the gaps are written, the samples themselves are kept as they are,
+    including NaN-values. Rows before the first sample are NaN.
+
+    """
+
+    def __init__(self, rows, start, stop):
+        """Initialization.
+
+        Arguments:
+        rows -- sorted unique rows of the samples
+        start -- first row of the merged dataframe that is filled
+        stop -- row after the last row that is filled
+
+        """
+        mask = np.zeros(stop - start, dtype=bool)
+        mask[rows[(rows >= start) & (rows < stop)] - start] = True
+        # gaps relative to start, gap_rows within all rows
+        self.gaps = np.flatnonzero(~mask)
+        gap_rows = self.gaps + start
+        prev = np.searchsorted(rows, gap_rows) - 1
+        self.before = prev < 0
+        self.prev = np.maximum(prev, 0)
+
+        # gaps between two samples are interpolated, gaps after the last
+        # sample hold it, the same as pandas interpolate
+        inner = np.flatnonzero(prev + 1 < rows.shape[0])
+        inner = inner[~self.before[inner]]
+        self.inner = inner
+        self.inner_next = self.prev[inner] + 1
+        self.inner_dx = (gap_rows[inner] - rows[self.prev[inner]]).astype(
+            np.float64
+        )
+        self.inner_dr = (
+            rows[self.inner_next] - rows[self.prev[inner]]
+        ).astype(np.float64)
+
+    def zoh(self, values):
+        """Return the values at the gaps with zero-order-hold."""
+        result = values[self.prev]
+        result[self.before] = np.nan
+        return result
+
+    def linear(self, values):
+        """Return the values at the gaps with linear interpolation.
+
+        The samples are treated as equally spaced rows, same as pandas
+        interpolate with default arguments. A gap next to a NaN-sample is
+        NaN.
+
+        """
+        result = self.zoh(values)
+        left = result[self.inner]
+        with np.errstate(invalid="ignore"):
+            slope = (values[self.inner_next] - left) / self.inner_dr
+            result[self.inner] = slope * self.inner_dx + left
+        return result
+
+
+def _window_rows(timestamps, start_us=None, end_us=None):
+    """Return the first row and the row after the last row of a time window.
+
+    Arguments:
+    timestamps -- sorted timestamps in microseconds
+
+    Keyword arguments:
+    start_us -- start of the window in microseconds (default None: first row)
+    end_us -- end of the window in microseconds, inclusive (default None: last row)
+
+    """
+    start, stop = 0, timestamps.shape[0]
+    if start_us is not None:
+        start = int(np.searchsorted(timestamps, start_us, side="left"))
+    if end_us is not None:
+        stop = int(np.searchsorted(timestamps, end_us, side="right"))
+    return start, max(start, stop)
+
+
+def _topic_rows(union, ts, interpolate, start=0, stop=None, sample_rows=None):
+    """Locate the samples of a topic within the rows start:stop of the union.
+
+    Only the samples within these rows and one sample on each side are used.
+    The rows are counted within the whole union, such that the result is the
+    same as the slice start:stop of merging all rows.
+
+    Returns the indices of the used samples, the slice of these samples that
+    are within the rows, their rows relative to start and the _GapFill of
+    the topic.
+
+    Arguments:
+    union -- sorted unique timestamps of the merged dataframe
+    ts -- sorted sample timestamps of the topic, unused if sample_rows is
+          provided
+    interpolate -- if False, the _GapFill is None
+
+    Keyword arguments:
+    start -- first row (default 0)
+    stop -- row after the last row (default None: all rows)
+    sample_rows -- result of _sample_rows(union, ts) if it was computed
+                   before (default None)
+
+    """
+    stop = union.shape[0] if stop is None else stop
+    if sample_rows is None:
+        sample_rows = _sample_rows(union, ts)
+    rows, keep = sample_rows
+    lo, hi = np.searchsorted(rows, [start, stop])
+    first, last = max(lo - 1, 0), min(hi + 1, rows.shape[0])
+    if isinstance(keep, slice):
+        samples = slice(first, last)
+    else:
+        samples = keep[first:last]
+    rows = rows[first:last]
+    inside = slice(lo - first, hi - first)
+
+    gap_fill = None
+    if interpolate and rows.shape[0] > 0 and hi - lo < stop - start:
+        gap_fill = _GapFill(rows, start, stop)
+    return samples, inside, rows[inside] - start, gap_fill
+
+
+def _zoh_positions(columns, topic_msgs_list):
+    """Return the positions of the columns on which zero-order-hold is used.
+
+    Arguments:
+    columns -- column names of the form T_topic_instance__F_field
+    topic_msgs_list -- list of TopicMsgs or None
+
+    """
+    zoh = set()
+    if topic_msgs_list:
+        column_index = ColumnIndex(columns)
+        for topic_msgs in topic_msgs_list:
+            zoh.update(
+                column_index.positions(topic_msgs.topic, topic_msgs.msgs)
+            )
+    return zoh
+
+
+def _scatter_column(out, values, inside, rows, gap_fill, zoh):
+    """Write the samples of one field and fill the gaps in a float64 array.
+
+    Arguments:
+    out -- float64 array of the merged column, NaN where nothing is written
+    values -- used sample values, see _topic_rows
+    inside -- slice of the samples that are within out
+    rows -- rows of the inside samples
+    gap_fill -- _GapFill of the topic or None if the gaps are not filled
+    zoh -- True if zero-order-hold is used instead of linear interpolation
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out[rows] = values[inside]
+    if gap_fill is None:
+        return
+    if zoh:
+        out[gap_fill.gaps] = gap_fill.zoh(values)
+    else:
+        out[gap_fill.gaps] = gap_fill.linear(values)
+
+
+def nullable_array(values, mask):
+    """Wrap integer or bool values into a pandas nullable array.
+
+    Arguments:
+    values -- integer or bool numpy array
+    mask -- bool numpy array, True where the value is missing
+
+    """
+    if values.dtype == np.bool_:
+        return pd.arrays.BooleanArray(values, mask)
+    return pd.arrays.IntegerArray(values, mask)
+
+
+def _merge_compact(values, inside, rows, n, gap_fill, zoh):
+    """Scatter the samples of one field into n rows keeping its dtype.
+
+    Float fields are filled the same as in merge_pandadict. Integer and
+    bool fields are always filled with zero-order-hold and returned as
+    nullable arrays, rows without value are missing.
+
+    Arguments:
+    values -- used sample values, see _topic_rows
+    inside -- slice of the samples that are within the n rows
+    rows -- rows of the inside samples
+    n -- number of rows
+    gap_fill -- _GapFill of the topic or None if the gaps are not filled
+    zoh -- True if zero-order-hold is used for float fields
+
+    """
+    if values.dtype.kind == "f":
+        result = np.full(n, np.nan, dtype=values.dtype)
+        result[rows] = values[inside]
+        if gap_fill is not None:
+            values = values.astype(np.float64)
+            if zoh:
+                result[gap_fill.gaps] = gap_fill.zoh(values)
+            else:
+                result[gap_fill.gaps] = gap_fill.linear(values)
+        return result
+
+    result = np.zeros(n, dtype=values.dtype)
+    mask = np.ones(n, dtype=bool)
+    result[rows] = values[inside]
+    mask[rows] = False
+    if gap_fill is not None:
+        result[gap_fill.gaps] = values[gap_fill.prev]
+        mask[gap_fill.gaps] = gap_fill.before
+    return nullable_array(result, mask)
+
+
+def merge_pandadict(
+    pandadict,
+    workers=None,
+    interpolate=False,
+    zoh_topic_msgs_list=None,
+    compact=False,
+    start_us=None,
+    end_us=None,
+):
     """Merge all dataframes within dictionanry.
 
+    The union of all timestamps is built once and the fields of each topic
+    are scattered into a preallocated array. Entries where a topic has no
+    sample are NaN. All fields are stored as float64. If a topic contains
+    the same timestamp more than once, the last sample is kept.
+
+    If interpolate is True, the entries where a topic has no sample are
+    filled from the neighbouring samples of that topic while scattering.
+    NaN-values of the log are kept and are not interpolated.
+
+    If compact is True, fields keep their dtype instead of float64. Integer
+    and bool fields are always filled with zero-order-hold and stored as
+    pandas nullable arrays, since they cannot hold NaN.
+
+    If start_us or end_us is provided, only the rows within the time window
+    are returned. They are identical to the same rows of merging everything,
+    since the rows are counted within all timestamps and one sample on each
+    side of the window is used for the interpolation.
+
+    Arguments:
+    pandadict -- a dictionary of pandas dataframe
+
+    Keyword arguments:
+    workers -- number of threads to scatter topics concurrently (default None)
+    interpolate -- fill the entries without sample (default False)
+    zoh_topic_msgs_list -- list of TopicMsgs which are filled with
+                           zero-order-hold instead of linear interpolation
+    compact -- keep the dtype of the fields (default False)
+    start_us -- start of the time window in microseconds (default None)
+    end_us -- end of the time window in microseconds, inclusive (default None)
+
+    """
+    combine_topic_fieldname(pandadict)
+    union, sample_rows = _merge_union(pandadict)
+    start, stop = _window_rows(union, start_us, end_us)
+    return _merge_rows(
+        pandadict,
+        union,
+        sample_rows,
+        start,
+        stop,
+        workers,
+        interpolate,
+        zoh_topic_msgs_list,
+        compact,
+    )
+
+
+def _merge_union(pandadict):
+    """Return the union of all timestamps and the sample rows of each topic.
+
+    Arguments:
+    pandadict -- a dictionary of pandas dataframe
+
+    """
+    timestamps = [
+        pandadict[topic]["timestamp"].values.astype(np.uint64)
+        for topic in pandadict
+    ]
+    union = np.unique(np.concatenate(timestamps))
+    return union, [_sample_rows(union, ts) for ts in timestamps]
+
+
+def _merge_rows(
+    pandadict,
+    union,
+    sample_rows,
+    start,
+    stop,
+    workers=None,
+    interpolate=False,
+    zoh_topic_msgs_list=None,
+    compact=False,
+):
+    """Merge the rows start:stop of the union of all timestamps.
+
+    See merge_pandadict, the column names are already combined.
+
     Arguments:
     pandadict -- a dictionary of pandas dataframe
+    union -- sorted unique timestamps of all topics
+    sample_rows -- list of _sample_rows of each topic within union
+    start -- first row
+    stop -- row after the last row
+
+    Keyword arguments:
+    workers -- number of threads to scatter topics concurrently (default None)
+    interpolate -- fill the entries without sample (default False)
+    zoh_topic_msgs_list -- list of TopicMsgs which are filled with
+                           zero-order-hold instead of linear interpolation
+    compact -- keep the dtype of the fields (default False)
+
+    """
+    n = stop - start
+    fields = [
+        [col for col in pandadict[topic].columns if col != "timestamp"]
+        for topic in pandadict
+    ]
+    ncols = sum(len(f) for f in fields)
+    columns = [col for topic_fields in fields for col in topic_fields]
+
+    zoh = set()
+    if interpolate:
+        zoh = _zoh_positions(columns, zoh_topic_msgs_list)
+
+    if compact:
+        arrays = [None] * ncols
+    else:
+        # one row per column such that the dataframe below wraps it without copy
+        data = np.full((ncols, n), np.nan)
+    first_cols = np.cumsum([0] + [len(f) for f in fields])
+
+    def scatter(args):
+        topic, topic_sample_rows, topic_fields, col = args
+        samples, inside, rows, gap_fill = _topic_rows(
+            union,
+            None,
+            interpolate,
+            start,
+            stop,
+            topic_sample_rows,
+        )
+        for i, field in enumerate(topic_fields):
+            values = pandadict[topic][field].values[samples]
+            if compact:
+                arrays[col + i] = _merge_compact(
+                    values, inside, rows, n, gap_fill, col + i in zoh
+                )
+            else:
+                _scatter_column(
+                    data[col + i],
+                    values,
+                    inside,
+                    rows,
+                    gap_fill,
+                    col + i in zoh,
+                )
+
+    _map(scatter, zip(pandadict, sample_rows, fields, first_cols), workers)
+
+    if compact:
+        return _create_compact_frame(union[start:stop], arrays, columns)
+    return _create_frame(union[start:stop], data, columns)
+
+
+def _chunk_rows(timestamps, chunk_us):
+    """Return the non-empty row ranges of chunks of chunk_us microseconds."""
+    if timestamps.shape[0] == 0:
+        return []
+    bounds = np.arange(
+        int(timestamps[0]), int(timestamps[-1]) + 1, chunk_us, dtype=np.uint64
+    )
+    starts = np.searchsorted(timestamps, bounds)
+    ends = np.append(starts[1:], timestamps.shape[0])
+    return [
+        (int(start), int(end))
+        for start, end in zip(starts, ends)
+        if start != end
+    ]
+
+
+def iter_merge_pandadict(
+    pandadict,
+    chunk_us,
+    interpolate=False,
+    zoh_topic_msgs_list=None,
+    compact=False,
+):
+    """Merge all dataframes within dictionary chunk by chunk.
+
+    Yield one dataframe per chunk of chunk_us microseconds. The union of all
+    timestamps is built once and the rows of each chunk are counted within
+    it, which gives the same result as merging everything at once.
+
+    Arguments:
+    pandadict -- a dictionary of pandas dataframe
+    chunk_us -- duration of each chunk in microseconds
+
+    Keyword arguments:
+    interpolate -- fill the entries without sample (default False)
+    zoh_topic_msgs_list -- list of TopicMsgs which are filled with
+                           zero-order-hold instead of linear interpolation
+    compact -- keep the dtype of the fields (default False)
 
     """
     combine_topic_fieldname(pandadict)
-    skip = True
-    for topic in pandadict:
-        if skip:
-            m = pandadict[topic]
-            skip = False
+    union, sample_rows = _merge_union(pandadict)
+    for start, stop in _chunk_rows(union, chunk_us):
+        yield _merge_rows(
+            pandadict,
+            union,
+            sample_rows,
+            start,
+            stop,
+            interpolate=interpolate,
+            zoh_topic_msgs_list=zoh_topic_msgs_list,
+            compact=compact,
+        )
+
+
+def _create_frame(timestamps, data, columns):
+    """Wrap an array with one row per column into a dataframe.
+
+    Arguments:
+    timestamps -- timestamps in microseconds
+    data -- numpy array of shape (len(columns), len(timestamps))
+    columns -- column names
+
+    """
+    df = pd.DataFrame(
+        data.T,
+        columns=columns,
+        index=pd.TimedeltaIndex(timestamps.astype(np.int64) * 1000),
+        copy=False,
+    )
+    df.insert(0, "timestamp", timestamps)
+    return df
+
+
+def _create_compact_frame(timestamps, arrays, columns):
+    """Create a dataframe from one array per column without copy.
+
+    Arguments:
+    timestamps -- timestamps in microseconds
+    arrays -- list of numpy or pandas arrays of len(timestamps)
+    columns -- column names
+
+    """
+    data = {"timestamp": timestamps}
+    data.update(zip(columns, arrays))
+    return pd.DataFrame(
+        data,
+        columns=["timestamp"] + columns,
+        index=pd.TimedeltaIndex(timestamps.astype(np.int64) * 1000),
+        copy=False,
+    )
+
+
+def create_grid(pandadict, rate_hz, start_us=None, end_us=None):
+    """Create uniformly spaced timestamps that cover all topics.
+
+    Arguments:
+    pandadict -- a dictionary of pandas dataframe
+    rate_hz -- rate of the grid in Hz
+
+    Keyword arguments:
+    start_us -- start of the grid in microseconds, if it is after the first sample (default None)
+    end_us -- end of the grid in microseconds, if it is before the last sample (default None)
+
+    """
+    start = min(df["timestamp"].values[0] for df in pandadict.values())
+    end = max(df["timestamp"].values[-1] for df in pandadict.values())
+    if start_us is not None:
+        start = max(start, start_us)
+    if end_us is not None:
+        end = min(end, end_us)
+    step = 1e6 / rate_hz
+    n = int((end - start) / step) + 1 if end >= start else 0
+    return np.uint64(start) + np.round(np.arange(n) * step).astype(np.uint64)
+
+
+def interpolate_linear(ts, values, timestamps):
+    """Linearly interpolate samples onto new timestamps.
+
+    Timestamps before the first sample are NaN, timestamps after the last
+    sample hold the last value.
+
+    Arguments:
+    ts -- sample timestamps
+    values -- sample values
+    timestamps -- timestamps to interpolate at
+
+    """
+    return np.interp(
+        timestamps.astype(np.float64),
+        ts.astype(np.float64),
+        values.astype(np.float64),
+        left=np.nan,
+    )
+
+
+def interpolate_zoh(ts, values, timestamps):
+    """Hold the last sample at new timestamps (zero-order-hold).
+
+    Timestamps before the first sample are NaN.
+
+    Arguments:
+    ts -- sample timestamps
+    values -- sample values
+    timestamps -- timestamps to interpolate at
+
+    """
+    idx = np.searchsorted(ts, timestamps, side="right") - 1
+    result = values.astype(np.float64)[np.maximum(idx, 0)]
+    result[idx < 0] = np.nan
+    return result
+
+
+def _resample_column(ts, values, timestamps, zoh, compact=False):
+    """Resample one field onto new timestamps.
+
+    If compact is True, the field keeps its dtype. Integer and bool fields
+    then use zero-order-hold and are returned as nullable arrays,
+    timestamps before the first sample are missing.
+
+    Arguments:
+    ts -- sample timestamps
+    values -- sample values
+    timestamps -- timestamps to interpolate at
+    zoh -- True if zero-order-hold is used for float fields
+
+    Keyword arguments:
+    compact -- keep the dtype of the field (default False)
+
+    """
+    interpolate = interpolate_zoh if zoh else interpolate_linear
+    if not compact:
+        return interpolate(ts, values, timestamps)
+    if values.dtype.kind == "f":
+        return interpolate(ts, values, timestamps).astype(values.dtype)
+    idx = np.searchsorted(ts, timestamps, side="right") - 1
+    return nullable_array(values[np.maximum(idx, 0)], idx < 0)
+
+
+def resample_pandadict(
+    pandadict,
+    timestamps,
+    zoh_topic_msgs_list=None,
+    workers=None,
+    compact=False,
+    start_us=None,
+    end_us=None,
+):
+    """Resample all dataframes within dictionary onto the given timestamps.
+
+    Fields are linearly interpolated unless they are part of
+    zoh_topic_msgs_list, in which case zero-order-hold is used.
+    If compact is True, fields keep their dtype, see merge_pandadict.
+    If start_us or end_us is provided, only the timestamps within the time
+    window are resampled, from the samples within the window and one sample
+    on each side.
+
+    Arguments:
+    pandadict -- a dictionary of pandas dataframe
+    timestamps -- timestamps in microseconds, i.e. from create_grid
+
+    Keyword arguments:
+    zoh_topic_msgs_list -- list of TopicMsgs on which zero-order-hold is used
+    workers -- number of threads to resample topics concurrently (default None)
+    compact -- keep the dtype of the fields (default False)
+    start_us -- start of the time window in microseconds (default None)
+    end_us -- end of the time window in microseconds, inclusive (default None)
+
+    """
+    timestamps = np.asarray(timestamps, dtype=np.uint64)
+    if start_us is not None or end_us is not None:
+        start, stop = _window_rows(timestamps, start_us, end_us)
+        timestamps = timestamps[start:stop]
+        if timestamps.shape[0] > 0:
+            pandadict = window_pandadict(
+                pandadict, timestamps[0], timestamps[-1]
+            )
+    combine_topic_fieldname(pandadict)
+
+    columns = [
+        col
+        for topic in pandadict
+        for col in pandadict[topic].columns
+        if col != "timestamp"
+    ]
+    zoh = {
+        columns[pos] for pos in _zoh_positions(columns, zoh_topic_msgs_list)
+    }
+    if compact:
+        arrays = [None] * len(columns)
+    else:
+        data = np.empty((len(columns), timestamps.shape[0]))
+    first_cols = np.cumsum(
+        [0] + [pandadict[topic].shape[1] - 1 for topic in pandadict]
+    )
+
+    def resample(args):
+        df, col = args
+        ts = df["timestamp"].values
+        for field in df.columns:
+            if field == "timestamp":
+                continue
+            values = _resample_column(
+                ts, df[field].values, timestamps, field in zoh, compact
+            )
+            if compact:
+                arrays[col] = values
+            else:
+                data[col] = values
+            col += 1
+
+    _map(resample, zip(pandadict.values(), first_cols), workers)
+
+    if compact:
+        return _create_compact_frame(timestamps, arrays, columns)
+    return _create_frame(timestamps, data, columns)
+
+
+def window_pandadict(pandadict, start_us=None, end_us=None):
+    """Return the samples of each topic within a time window.
+
+    One sample on each side of the window is kept, such that interpolation
+    at the edges of the window is the same as with all samples. The
+    dataframes are sliced without copying the data.
+
+    Arguments:
+    pandadict -- a dictionary of pandas dataframe
+
+    Keyword arguments:
+    start_us -- start of the window in microseconds (default None)
+    end_us -- end of the window in microseconds, inclusive (default None)
+
+    """
+    window = {}
+    for topic, df in pandadict.items():
+        ts = df["timestamp"].values
+        first, last = 0, ts.shape[0]
+        if start_us is not None:
+            first = max(np.searchsorted(ts, start_us, side="right") - 1, 0)
+        if end_us is not None:
+            last = np.searchsorted(ts, end_us, side="left") + 1
+        window[topic] = df.iloc[first:last].copy(deep=False)
+    return window
+
+
+def iter_resample_pandadict(
+    pandadict, timestamps, chunk_us, zoh_topic_msgs_list=None, compact=False
+):
+    """Resample all dataframes within dictionary chunk by chunk.
+
+    Yield one dataframe per chunk of chunk_us microseconds. Only the samples
+    of each topic within the chunk and one sample on each side are used,
+    which gives the same result as resampling everything at once.
+
+    Arguments:
+    pandadict -- a dictionary of pandas dataframe
+    timestamps -- timestamps in microseconds, i.e. from create_grid
+    chunk_us -- duration of each chunk in microseconds
+
+    Keyword arguments:
+    zoh_topic_msgs_list -- list of TopicMsgs on which zero-order-hold is used
+    compact -- keep the dtype of the fields (default False)
+
+    """
+    timestamps = np.asarray(timestamps, dtype=np.uint64)
+    for start, end in _chunk_rows(timestamps, chunk_us):
+        chunk = timestamps[start:end]
+        window = window_pandadict(pandadict, chunk[0], chunk[-1])
+        yield resample_pandadict(
+            window, chunk, zoh_topic_msgs_list, compact=compact
+        )
+
+
+class LazyFrame:
+    """Dataframe-like view of merged topics that computes columns on first access.
+
+    Only the timestamps of the merged dataframe are built up front. Each
+    column is merged and interpolated, the same as merge_pandadict with
+    interpolate=True or resample_pandadict with a grid, the first time it
+    is accessed through lazy_frame[column] and is cached afterwards.
+    Accessing a few columns therefore only costs these columns.
+
+    Columns can be accessed by item or by attribute and new columns can be
+    assigned. to_frame returns a pandas dataframe of all columns.
+
+    """
+
+    def __init__(
+        self,
+        pandadict,
+        timestamps=None,
+        zoh_topic_msgs_list=None,
+        compact=False,
+        start_us=None,
+        end_us=None,
+    ):
+        """Initialization.
+
+        Arguments:
+        pandadict -- a dictionary of pandas dataframe
+
+        Keyword arguments:
+        timestamps -- timestamps in microseconds onto which the topics are resampled
+                      (default None: union of all topic timestamps)
+        zoh_topic_msgs_list -- list of TopicMsgs on which zero-order-hold is used
+        compact -- keep the dtype of the fields, see merge_pandadict (default False)
+        start_us -- start of the time window in microseconds (default None)
+        end_us -- end of the time window in microseconds, inclusive (default None)
+
+        """
+        combine_topic_fieldname(pandadict)
+        self._compact = compact
+        self._grid = timestamps is not None
+        if self._grid:
+            timestamps = np.asarray(timestamps, dtype=np.uint64)
+            self._start, self._stop = _window_rows(
+                timestamps, start_us, end_us
+            )
+            timestamps = timestamps[self._start : self._stop]
+            if timestamps.shape[0] > 0:
+                pandadict = window_pandadict(
+                    pandadict, timestamps[0], timestamps[-1]
+                )
         else:
-            m = pd.merge_ordered(
-                m, pandadict[topic], on="timestamp", how="outer"
+            timestamps = np.unique(
+                np.concatenate(
+                    [
+                        df["timestamp"].values.astype(np.uint64)
+                        for df in pandadict.values()
+                    ]
+                )
+            )
+            self._start, self._stop = _window_rows(
+                timestamps, start_us, end_us
+            )
+        # all timestamps of the merged topics, the rows are counted within them
+        self._union = timestamps
+        self._pandadict = pandadict
+        self.timestamps = timestamps
+        if not self._grid:
+            self.timestamps = timestamps[self._start : self._stop]
+        self.index = pd.TimedeltaIndex(self.timestamps.astype(np.int64) * 1000)
+
+        self._topics = {
+            col: topic
+            for topic, df in pandadict.items()
+            for col in df.columns
+            if col != "timestamp"
+        }
+        fields = list(self._topics)
+        self._zoh = {
+            fields[pos] for pos in _zoh_positions(fields, zoh_topic_msgs_list)
+        }
+        self.columns = pd.Index(["timestamp"] + fields)
+        self._rows = {}
+        self._cache = {
+            "timestamp": pd.Series(
+                self.timestamps, index=self.index, name="timestamp"
             )
-    m.index = pd.TimedeltaIndex(m.timestamp * 1e3, unit="ns")
-    return m
+        }
 
+    def _compute(self, col):
+        """Merge and interpolate a single column."""
+        topic = self._topics[col]
+        df = self._pandadict[topic]
+        if self._grid:
+            return _resample_column(
+                df["timestamp"].values,
+                df[col].values,
+                self.timestamps,
+                col in self._zoh,
+                self._compact,
+            )
 
-def apply_zoh(df, topic_msgs_list):
+        if topic not in self._rows:
+            self._rows[topic] = _topic_rows(
+                self._union,
+                df["timestamp"].values.astype(np.uint64),
+                True,
+                self._start,
+                self._stop,
+            )
+        samples, inside, rows, gap_fill = self._rows[topic]
+        values = df[col].values[samples]
+        n = self.timestamps.shape[0]
+        if self._compact:
+            return _merge_compact(
+                values, inside, rows, n, gap_fill, col in self._zoh
+            )
+        data = np.full(n, np.nan)
+        _scatter_column(data, values, inside, rows, gap_fill, col in self._zoh)
+        return data
+
+    def __getitem__(self, key):
+        """Return a column as series or a list of columns as dataframe."""
+        if isinstance(key, str):
+            if key not in self._cache:
+                if key not in self._topics:
+                    raise KeyError(key)
+                self._cache[key] = pd.Series(
+                    self._compute(key), index=self.index, name=key
+                )
+            return self._cache[key]
+        return pd.DataFrame(
+            {col: self[col] for col in key}, columns=list(key), copy=False
+        )
+
+    def __setitem__(self, key, values):
+        """Add or replace a column."""
+        self._cache[key] = pd.Series(values, index=self.index, name=key)
+        if key not in self.columns:
+            self.columns = self.columns.append(pd.Index([key]))
+
+    def __getattr__(self, name):
+        """Return a column by attribute, i.e. lazy_frame.timestamp."""
+        if not name.startswith("_") and name in self.__dict__.get(
+            "columns", ()
+        ):
+            return self[name]
+        raise AttributeError(name)
+
+    def __contains__(self, key):
+        """Return True if key is a column."""
+        return key in self.columns
+
+    def __len__(self):
+        """Return the number of rows."""
+        return self.timestamps.shape[0]
+
+    @property
+    def shape(self):
+        """Return the number of rows and columns."""
+        return (len(self), len(self.columns))
+
+    @property
+    def materialized(self):
+        """Return the columns that have been computed."""
+        return [col for col in self.columns if col in self._cache]
+
+    def memory_usage(self, index=False):
+        """Return the memory of the computed columns in bytes as series.
+
+        Keyword arguments:
+        index -- include the memory of the index (default False)
+
+        """
+        usage = pd.Series(
+            {
+                col: self._cache[col].memory_usage(index=False)
+                for col in self.materialized
+            },
+            dtype=np.int64,
+        )
+        if index:
+            usage = pd.concat(
+                [pd.Series({"Index": self.index.memory_usage()}), usage]
+            )
+        return usage
+
+    def to_frame(self):
+        """Compute all columns and return them as pandas dataframe."""
+        return self[list(self.columns)]
+
+
+def apply_zoh(df, topic_msgs_list, workers=None, column_index=None):
     """Apply zero-order-hold to msgs.
 
     Arguments:
     df -- dataframe of all msgs
     topic_msgs_list -- list of topicMsgs on which zoh is going to be applied
+
+    Keyword arguments:
+    workers -- number of threads to fill topics concurrently (default None)
+    column_index -- ColumnIndex of df (default None: built from df.columns)
+
+    """
+    if column_index is None:
+        column_index = ColumnIndex(df.columns)
+
+    position_lists = [
+        column_index.positions(topic_msgs.topic, topic_msgs.msgs)
+        for topic_msgs in topic_msgs_list
+    ]
+    if not workers or workers <= 1:
+        # fill all columns in one block
+        position_lists = [
+            list(dict.fromkeys(p for ps in position_lists for p in ps))
+        ]
+    position_lists = [positions for positions in position_lists if positions]
+
+    # the fills are computed concurrently, but assigned one after the other
+    for positions, filled in zip(
+        position_lists,
+        _map(
+            lambda positions: df.iloc[:, positions].ffill().values,
+            position_lists,
+            workers,
+        ),
+    ):
+        df.iloc[:, positions] = filled
+
+
+def interpolate_nan(values):
+    """Linearly interpolate the NaN-values of an array in place.
+
+    Same as pandas interpolate with default arguments: samples are treated
+    as equally spaced, leading NaN-values are kept and trailing NaN-values
+    hold the last valid value.
+
+    Arguments:
+    values -- one-dimensional float numpy array
+
+    """
+    valid = ~np.isnan(values)
+    valid_ind = np.flatnonzero(valid)
+    if valid_ind.shape[0] in (0, values.shape[0]):
+        return values
+    missing_ind = np.flatnonzero(~valid)
+    values[missing_ind] = np.interp(missing_ind, valid_ind, values[valid_ind])
+    values[: valid_ind[0]] = np.nan
+    return values
+
+
+def interpolate_pandaframe(df, workers=None, column_index=None):
+    """Linearly interpolate the NaN-values of a merged dataframe in place.
+
+    Same as df.interpolate(), but computed per column with numpy. The topics
+    are interpolated concurrently if workers > 1.
+
+    Arguments:
+    df -- dataframe of all msgs
+
+    Keyword arguments:
+    workers -- number of threads to interpolate topics concurrently (default None)
+    column_index -- ColumnIndex of df (default None: built from df.columns)
+
     """
-    for topicMsgs in topic_msgs_list:
-        regex = topicMsgs.topic + ".+"
-        if topicMsgs.msgs:
-            regex = regex + "["
-            for msg in topicMsgs.msgs:
-                regex = "{0}({1})".format(regex, msg)
-            regex = regex + "]"
-        df[list(df.filter(regex=regex).columns)] = df[
-            list(df.filter(regex=regex).columns)
-        ].fillna(method="ffill")
+    if column_index is None:
+        column_index = ColumnIndex(df.columns)
+
+    def interpolate(positions):
+        data = np.array(df.iloc[:, positions].values.T, dtype=np.float64)
+        for values in data:
+            interpolate_nan(values)
+        return data.T
+
+    position_lists = column_index.groups()
+    for positions, data in zip(
+        position_lists, _map(interpolate, position_lists, workers)
+    ):
+        df.iloc[:, positions] = data
 
 
 def combine_topic_fieldname(pandadict):
     """Add topic name to field-name except for timestamp field.
 
+    Only the column labels are replaced, the data is not copied.
+
     Arguments:
     pandadict -- a dictionary of pandas dataframe
 
     """
     for topic in pandadict.keys():
-        ncol = {}
-        for col in pandadict[topic].columns:
-            if col == "timestamp":
-                ncol[col] = col
-            else:
-                ncol[col] = topic + "__" + col
-        pandadict[topic].rename(columns=ncol, inplace=True)
+        pandadict[topic].columns = [
+            col if col == "timestamp" else topic + "__" + col
+            for col in pandadict[topic].columns
+        ]
     return
@@ -6,9 +6,18 @@ Create pandas dataframe
 
 """
 import os
+import collections
+import concurrent.futures
+import shutil
+import tempfile
+import time
+import warnings
 from pyulgresample import loginfo
+from pyulgresample import ulogcache
 from pyulgresample import ulogconv as conv
+from pyulgresample import ulogparquet
 import numpy as np
+import pandas as pd
 
 
 class TopicMsgs:
@@ -26,6 +35,121 @@ class TopicMsgs:
         self.msgs = msgs
 
 
+CreateResult = collections.namedtuple(
+    "CreateResult", ["filepath", "dfulg", "error"]
+)
+CreateResult.__doc__ = """Result of DfUlg.create_many.
+
+filepath -- path to .ulg file
+dfulg -- DfUlg object or None if the conversion failed
+error -- exception raised by the conversion or None
+
+"""
+
+
+StageStats = collections.namedtuple(
+    "StageStats", ["stage", "time_s", "rows", "columns", "bytes"]
+)
+StageStats.__doc__ = """Statistics of a stage of DfUlg.create.
+
+stage -- name of the stage
+time_s -- wall time of the stage in seconds
+rows -- number of rows (samples) produced by the stage
+columns -- number of columns (fields) produced by the stage
+bytes -- bytes allocated for the result of the stage
+
+"""
+
+
+def _stage_size(result):
+    """Return rows, columns and allocated bytes of the result of a stage."""
+    if hasattr(result, "data_list"):
+        # ulog structure
+        data = [msg.data for msg in result.data_list]
+        return (
+            sum(len(d["timestamp"]) for d in data),
+            sum(len(d) for d in data),
+            sum(v.nbytes for d in data for v in d.values()),
+        )
+    if isinstance(result, dict):
+        # pandadict, the frames wrap the ulog arrays, only the index is new
+        return (
+            sum(len(df) for df in result.values()),
+            sum(len(df.columns) for df in result.values()),
+            sum(df.index.nbytes for df in result.values()),
+        )
+    if isinstance(result, np.ndarray):
+        return len(result), 1, result.nbytes
+    return (
+        len(result),
+        len(result.columns),
+        int(result.memory_usage(index=True).sum()),
+    )
+
+
+class _StageTimer:
+    """Record StageStats of consecutive stages."""
+
+    def __init__(self, callback):
+        """Initialization.
+
+        Arguments:
+        callback -- function called with each StageStats or None
+
+        """
+        self.stats = []
+        self.callback = callback
+        self._start = time.perf_counter()
+
+    def stop(self, stage, result):
+        """Record the stage that produced result and start the next stage."""
+        time_s = time.perf_counter() - self._start
+        stats = StageStats(stage, time_s, *_stage_size(result))
+        self.stats.append(stats)
+        if self.callback is not None:
+            self.callback(stats)
+        self._start = time.perf_counter()
+
+
+def _create_in_worker(filepath, directory, kwargs):
+    """Create a DfUlg object and store it in directory.
+
+    Runs in a worker process of DfUlg.create_many. The dataframe and the ulog structure are
+    written to memory-mappable files, such that they do not need to be pickled.
+
+    Arguments:
+    filepath -- path to .ulg file
+    directory -- directory for the results of this file
+    kwargs -- keyword arguments of DfUlg.create
+
+    """
+    try:
+        dfulg = DfUlg.create(filepath, **kwargs)
+        os.makedirs(os.path.join(directory, "df"))
+        os.makedirs(os.path.join(directory, "ulog"))
+        ulogcache.save_frame(os.path.join(directory, "df"), dfulg.df)
+        ulogcache.save_ulog(os.path.join(directory, "ulog"), dfulg.ulog)
+    except Exception as e:
+        return e
+    return None
+
+
+def _add_column(df, name, values):
+    """Add a column to a dataframe, which may consist of one block per column.
+
+    Compact dataframes cannot be consolidated, pandas would warn about fragmentation.
+
+    Arguments:
+    df -- dataframe
+    name -- column name
+    values -- column values
+
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+        df[name] = values
+
+
 class DfUlg:
     """Class that contains ulog-structure and pandas-dataframe for a set of topics.
 
@@ -41,12 +165,118 @@ class DfUlg:
         Arguments:
         df -- pandas dataframe with uORB msgs from topics (resampled)
         ulog -- pyulog struct of uORB msgs (without resampling)
-        topics -- list of topics that are used to generate df and ulog
+        topics -- list of topics or TopicMsgs that are used to generate df and ulog
 
         """
         self.df = df  # pandas dataframe
         self.ulog = ulog  # ulog
         self.topics = topics  # uorb topics
+        self._column_index = None
+        self.stats = None  # list of StageStats, set by create
+
+    @property
+    def column_index(self):
+        """ColumnIndex of the dataframe, rebuilt if the columns have changed."""
+        if (
+            self._column_index is None
+            or self._column_index.columns is not self.df.columns
+        ):
+            self._column_index = conv.ColumnIndex(self.df.columns)
+        return self._column_index
+
+    def get_columns(self, topic, msgs=None, instance=None):
+        """Return the column names of a topic.
+
+        Arguments:
+        topic -- topic name, i.e. vehicle_attitude
+
+        Keyword arguments:
+        msgs -- list of msgs, i.e. ["q[0]"] or ["q"] for all elements of an array
+                (default None: all fields of the topic)
+        instance -- topic instance (default None: all instances)
+
+        """
+        return self.column_index.names(topic, msgs, instance)
+
+    def memory_usage(self):
+        """Return the memory used by the dataframe columns.
+
+        Returns a dictionary with the bytes of the columns, the bytes they would need as float64
+        and the bytes saved compared to float64, i.e. by create with compact=True.
+        For a lazy dataframe, only the columns that have been computed are counted.
+
+        """
+        usage = self.df.memory_usage(index=False)
+        nbytes = int(usage.sum())
+        float64_bytes = 8 * len(self.df) * len(usage)
+        return {
+            "bytes": nbytes,
+            "float64_bytes": float64_bytes,
+            "saved_bytes": float64_bytes - nbytes,
+        }
+
+    def save(self, path, log_id=None, compression="zstd", row_group_s=None):
+        """Store the dataframe and the metadata in a Parquet file.
+
+        The topics, the topic, instance and field of each column and the
+        metadata of the ulog structure are stored with the dataframe, the
+        topic arrays of the ulog structure are not stored. A lazy dataframe
+        is computed completely. Requires pyarrow.
+
+        Returns the path of the written file.
+
+        Arguments:
+        path -- path to the file, or root directory of the dataset if log_id is provided
+
+        Keyword arguments:
+        log_id -- write into the partition log_id=<log_id> of a dataset (default None)
+        compression -- compression codec of pyarrow, i.e. zstd, snappy or none (default zstd)
+        row_group_s -- seconds of log time per row group, such that readers can skip
+                       time ranges (default None: one row group)
+
+        """
+        df = self.df
+        if isinstance(df, conv.LazyFrame):
+            df = df.to_frame()
+        if log_id is not None:
+            path = ulogparquet.partition_path(path, log_id)
+
+        meta = {
+            "topics": [
+                [t.topic, t.msgs] if isinstance(t, TopicMsgs) else t
+                for t in self.topics or []
+            ],
+            "fields": conv.ColumnIndex(df.columns).fields(),
+            "ulog": ulogcache.ulog_meta(self.ulog),
+        }
+        ulogparquet.write_frame(path, df, meta, compression, row_group_s)
+        return path
+
+    @classmethod
+    def load(cls, path, log_id=None, columns=None, start_us=None, end_us=None):
+        """Load a DfUlg object stored with save.
+
+        Only the given columns and the row groups of the time range are read.
+        The ulog structure provides the metadata of the log, but no topic
+        arrays.
+
+        Arguments:
+        path -- path to the file, or root directory of the dataset if log_id is provided
+
+        Keyword arguments:
+        log_id -- read from the partition log_id=<log_id> of a dataset (default None)
+        columns -- list of column names (default None: all columns)
+        start_us -- first timestamp in microseconds (default None: start of log)
+        end_us -- last timestamp in microseconds (default None: end of log)
+
+        """
+        if log_id is not None:
+            path = ulogparquet.partition_path(path, log_id)
+        df, meta = ulogparquet.read_frame(path, columns, start_us, end_us)
+        topics = [
+            TopicMsgs(*t) if isinstance(t, list) else t for t in meta["topics"]
+        ]
+        return cls(df, ulogcache.CachedULog(meta["ulog"], []), topics or None)
 
     @classmethod
     def _check_file(self, filepath):
@@ -63,6 +293,44 @@ class DfUlg:
         else:
             raise Exception("File does not exist")
 
+    @classmethod
+    def _read_ulog(cls, filepath, topics, cache):
+        """Check the file and read the ulog structure.
+
+        Arguments:
+        filepath -- path to .ulg file
+        topics -- list of topics
+        cache -- ULogCache or None
+
+        """
+        # check if valid file is provided
+        cls._check_file(filepath)
+
+        ulog = loginfo.get_ulog(filepath, topics, cache)
+
+        if ulog is None:
+            raise Exception("Ulog is empty")
+
+        return ulog
+
+    @staticmethod
+    def _window_us(ulog, timestamp_us, timestamp_s):
+        """Return a window boundary in microseconds.
+
+        Arguments:
+        ulog -- ulog structure
+        timestamp_us -- boundary in microseconds or None
+        timestamp_s -- boundary in seconds since the start of the log or None
+
+        """
+        if timestamp_s is None:
+            return timestamp_us
+        if timestamp_us is not None:
+            raise Exception(
+                "A window boundary can only be provided in microseconds or seconds"
+            )
+        return ulog.start_timestamp + int(round(timestamp_s * 1e6))
+
     @classmethod
     def create(
         cls,
@@ -70,6 +338,17 @@ class DfUlg:
         topics=None,
         zoh_topic_msgs_list=None,
         nan_topic_msgs_list=None,
+        rate_hz=None,
+        grid=None,
+        cache=None,
+        workers=None,
+        compact=False,
+        lazy=False,
+        start_us=None,
+        end_us=None,
+        start_s=None,
+        end_s=None,
+        callback=None,
     ):
         """Factory method. Create a DfUlg object.
 
@@ -84,49 +363,237 @@ class DfUlg:
         The topic name is followed by a number, which indicates the topic instance. If there is only one instance of a specific topic, then this number will be 0.
         The instance number is followed by two underlines and a capital letter F, which stands for field. In the example above, the field in question is x.
 
+        If rate_hz or grid is provided, every topic is interpolated directly onto a uniform time grid
+        instead of the union of all topic timestamps.
+
+        If compact is True, the fields keep the dtype of the ulog instead of float64. Float32 fields
+        stay float32, integer and bool fields are resampled with zero-order-hold and stored as pandas
+        nullable arrays, which are missing before the first sample of the topic.
+        memory_usage reports how much memory this saves.
+
+        If lazy is True, df is a ulogconv.LazyFrame, which only holds the timestamps and resamples
+        each column the first time it is accessed. Reading a few fields of a large log then only
+        costs these fields. LazyFrame.to_frame returns the complete pandas dataframe.
+
+        If start_us/end_us or start_s/end_s are provided, only the rows within this time window are
+        merged and interpolated. One sample of each topic on each side of the window is used, such
+        that the rows are the same as the rows of the complete dataframe within the window.
+        With rate_hz, the grid starts at the beginning of the window.
+
+        The wall time, rows, columns and allocated bytes of each stage are stored as list of
+        StageStats in stats of the returned object, i.e. pd.DataFrame(dfulg.stats). The stages
+        are read_ulog, create_pandadict, create_grid (with rate_hz), one of lazy_frame,
+        resample_pandadict or merge_pandadict, and timestamp_s. Merging, zero-order-hold and
+        interpolation are a single pass over the columns and are therefore a single stage.
+
         Arguments:
         filepath -- path to .ulg file
 
         Keyword arguments:
+        topics -- list of topics or TopicMsgs. If msgs of a TopicMsgs are provided, only these
+                  fields are converted and merged, i.e. TopicMsgs("vehicle_attitude", ["q"])
+                  (default None: all topics)
         nan_topic_msgs_list -- list of TopicMsgs which contain Nan-values
         zoh_topic_msgs_list -- list of TopicMsgs on which zero-order-hold interpolation is used
+        rate_hz -- rate in Hz of a uniform time grid that covers all topics (default None)
+        grid -- timestamps in microseconds onto which all topics are resampled (default None)
+        cache -- ULogCache to skip parsing of previously read files (default None)
+        workers -- number of threads to convert, fill and interpolate topics concurrently.
+                   The result is identical to the serial conversion (default None: serial)
+        compact -- keep the dtype of the ulog fields (default False)
+        lazy -- resample columns on first access (default False)
+        start_us -- start of the time window in microseconds (default None)
+        end_us -- end of the time window in microseconds, inclusive (default None)
+        start_s -- start of the time window in seconds since the start of the log (default None)
+        end_s -- end of the time window in seconds since the start of the log (default None)
+        callback -- function called with the StageStats of each stage when it completes,
+                    i.e. to export them to a metrics system (default None)
 
         """
-        # check if valid file is provided
-        cls._check_file(filepath)
+        if rate_hz is not None and grid is not None:
+            raise Exception("Only one of rate_hz and grid can be provided")
 
-        ulog = loginfo.get_ulog(filepath, topics)
+        timer = _StageTimer(callback)
+        ulog = cls._read_ulog(filepath, topics, cache)
+        timer.stop("read_ulog", ulog)
+        start_us = cls._window_us(ulog, start_us, start_s)
+        end_us = cls._window_us(ulog, end_us, end_s)
 
-        if ulog is None:
-            raise Exception("Ulog is empty")
+        # create pandadict
+        pandadict = conv.create_pandadict(ulog, workers)
+        timer.stop("create_pandadict", pandadict)
+
+        # msgs, which contain nan, are resampled with zoh as well
+        zoh_topic_msgs_list = (zoh_topic_msgs_list or []) + (
+            nan_topic_msgs_list or []
+        )
+        if rate_hz is not None:
+            grid = conv.create_grid(pandadict, rate_hz, start_us, end_us)
+            timer.stop("create_grid", grid)
+
+        if lazy:
+            # columns are resampled when they are accessed
+            df = conv.LazyFrame(
+                pandadict,
+                grid,
+                zoh_topic_msgs_list,
+                compact,
+                start_us,
+                end_us,
+            )
+            timer.stop("lazy_frame", df)
+        elif grid is not None:
+            # resample each topic directly onto the grid
+            df = conv.resample_pandadict(
+                pandadict,
+                grid,
+                zoh_topic_msgs_list,
+                workers,
+                compact,
+                start_us,
+                end_us,
+            )
+            timer.stop("resample_pandadict", df)
+        else:
+            # merge pandadict to a complete pandaframe
+            # entries where a topic has no sample are linearly interpolated,
+            # or held for zoh msgs and msgs which contain nan
+            df = conv.merge_pandadict(
+                pandadict,
+                workers,
+                interpolate=True,
+                zoh_topic_msgs_list=zoh_topic_msgs_list,
+                compact=compact,
+                start_us=start_us,
+                end_us=end_us,
+            )
+            timer.stop("merge_pandadict", df)
+
+        if len(df) == 0:
+            raise Exception("No samples within the time window")
+
+        # add seconds
+        _add_column(
+            df, "timestamp_s", (df.timestamp - df.timestamp.iloc[0]) * 1e-6
+        )
+        timer.stop("timestamp_s", np.asarray(df["timestamp_s"]))
 
-        # replace nan with inf
-        # this is needed because inf-values are considered as numerical values and therefore are not interpolated below
-        if nan_topic_msgs_list:
-            conv.replace_nan_with_inf(ulog, nan_topic_msgs_list)
+        dfulg = cls(df, ulog, topics)
+        dfulg.stats = timer.stats
+        return dfulg
 
-        # create pandadict
+    @classmethod
+    def create_chunks(
+        cls,
+        filepath,
+        topics=None,
+        zoh_topic_msgs_list=None,
+        nan_topic_msgs_list=None,
+        rate_hz=None,
+        grid=None,
+        chunk_s=60.0,
+        cache=None,
+        compact=False,
+    ):
+        """Generator. Yield the resampled dataframe in chunks of chunk_s seconds.
+
+        The chunks are identical to consecutive slices of the dataframe created by create with the
+        same arguments. With rate_hz or grid, each chunk is interpolated from the samples of each
+        topic that are inside the chunk plus one sample on each side, such that interpolation
+        across chunk boundaries is correct. Otherwise the union of all timestamps is built once
+        and each chunk is merged from its rows of the union. The merged and resampled dataframe
+        of the whole log is never held in memory.
+
+        Arguments:
+        filepath -- path to .ulg file
+
+        Keyword arguments:
+        topics -- list of topics or TopicMsgs, see create
+        nan_topic_msgs_list -- list of TopicMsgs which contain Nan-values
+        zoh_topic_msgs_list -- list of TopicMsgs on which zero-order-hold interpolation is used
+        rate_hz -- rate in Hz of a uniform time grid that covers all topics
+                   (default None: union of all topic timestamps)
+        grid -- timestamps in microseconds onto which all topics are resampled (default None)
+        chunk_s -- duration of each chunk in seconds (default 60.0)
+        cache -- ULogCache to skip parsing of previously read files (default None)
+        compact -- keep the dtype of the ulog fields, see create (default False)
+
+        """
+        if rate_hz is not None and grid is not None:
+            raise Exception("Only one of rate_hz and grid can be provided")
+
+        ulog = cls._read_ulog(filepath, topics, cache)
         pandadict = conv.create_pandadict(ulog)
+        zoh_topic_msgs_list = (zoh_topic_msgs_list or []) + (
+            nan_topic_msgs_list or []
+        )
+        chunk_us = int(chunk_s * 1e6)
+        if rate_hz is not None:
+            grid = conv.create_grid(pandadict, rate_hz)
+        if grid is not None:
+            chunks = conv.iter_resample_pandadict(
+                pandadict, grid, chunk_us, zoh_topic_msgs_list, compact
+            )
+        else:
+            chunks = conv.iter_merge_pandadict(
+                pandadict, chunk_us, True, zoh_topic_msgs_list, compact
+            )
 
-        # merge pandadict to a complete pandaframe
-        df = conv.merge_pandadict(pandadict)
+        first = None
+        for df in chunks:
+            if first is None:
+                first = df.timestamp.iloc[0]
+            _add_column(df, "timestamp_s", (df.timestamp - first) * 1e-6)
+            yield df
 
-        # apply zero order hold
-        if zoh_topic_msgs_list:
-            conv.apply_zoh(df, zoh_topic_msgs_list)
+    @classmethod
+    def create_many(cls, filepaths, topics=None, workers=None, **kwargs):
+        """Generator. Create DfUlg objects for many files in a process pool.
 
-        # we also apply zoh for msgs, which contain nan
-        # TODO: this is just for the time being until a better solution is found
-        if nan_topic_msgs_list:
-            conv.apply_zoh(df, nan_topic_msgs_list)
+        Yield a CreateResult for each file as soon as its conversion completes, which is not
+        necessarily the order of filepaths. If the conversion of a file fails, the result
+        contains the error and the remaining files are still converted.
+        The workers store the results in memory-mapped files, from which the dataframes and
+        ulog structures are restored without copy.
 
-        # linearly interpolate
-        # only NaN values get interpolated, and therefore the zero order hold values from before do not get overwritten
-        df.interpolate(mehtod="linear", inplace=True)
+        Arguments:
+        filepaths -- list of paths to .ulg files
 
-        # after interpolation, we can replace the inf-values back to nan-values
-        df.replace(np.inf, np.nan, inplace=True)
+        Keyword arguments:
+        topics -- list of topics or TopicMsgs, see create
+        workers -- number of worker processes (default None: number of processors)
+        kwargs -- further keyword arguments of create
 
-        # add seconds
-        df["timestamp_s"] = (df.timestamp - df.timestamp[0]) * 1e-6
-        return cls(df, ulog, topics)
+        """
+        kwargs["topics"] = topics
+        tmp = tempfile.mkdtemp(prefix="pyulgresample_")
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        futures = {}
+        try:
+            for i, filepath in enumerate(filepaths):
+                directory = os.path.join(tmp, str(i))
+                future = executor.submit(
+                    _create_in_worker, filepath, directory, kwargs
+                )
+                futures[future] = (filepath, directory)
+
+            for future in concurrent.futures.as_completed(futures):
+                filepath, directory = futures[future]
+                try:
+                    error = future.result()
+                except Exception as e:
+                    error = e
+                if error is not None:
+                    yield CreateResult(filepath, None, error)
+                    continue
+
+                df = ulogcache.load_frame(os.path.join(directory, "df"))
+                ulog = ulogcache.load_ulog(os.path.join(directory, "ulog"))
+                # the memory maps stay valid after the files are removed
+                shutil.rmtree(directory, ignore_errors=True)
+                yield CreateResult(filepath, cls(df, ulog, topics), None)
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            shutil.rmtree(tmp, ignore_errors=True)
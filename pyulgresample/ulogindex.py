@@ -0,0 +1,265 @@
+"""Searchable index of a directory tree of ulog files.
+
+The index is a SQLite database with one row per log, the topic instances
+with their number of messages and the initial parameters of each log.
+Logs are only read again if their size or modification time changed, such
+that updating the index of a large archive is fast. The logs are read with
+loginfo.get_ulog_info and loginfo.get_message_counts, without parsing the
+logged data.
+
+"""
+import concurrent.futures
+import os
+import sqlite3
+from pyulgresample import loginfo
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    start_timestamp INTEGER,
+    last_timestamp INTEGER,
+    duration_s REAL
+);
+CREATE TABLE IF NOT EXISTS topics (
+    log_id INTEGER NOT NULL REFERENCES logs(id) ON DELETE CASCADE,
+    topic TEXT NOT NULL,
+    instances INTEGER NOT NULL,
+    messages INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS params (
+    log_id INTEGER NOT NULL REFERENCES logs(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS topics_topic ON topics(topic, log_id);
+CREATE INDEX IF NOT EXISTS params_name ON params(name, value, log_id);
+CREATE INDEX IF NOT EXISTS logs_duration ON logs(duration_s);
+"""
+
+_OPERATORS = ("<", "<=", "=", "==", "!=", ">=", ">")
+
+
+def scan_log(filepath, params=None):
+    """Return the index entry of a ulg file.
+
+    Arguments:
+    filepath -- path to .ulg file
+
+    Keyword arguments:
+    params -- list of parameter names to store (default None: all parameters)
+
+    """
+    info = loginfo.get_ulog_info(filepath)
+    counts = loginfo.get_message_counts(filepath)
+    topics = {}
+    for (topic, _), count in counts.items():
+        instances, messages = topics.get(topic, (0, 0))
+        topics[topic] = (instances + 1, messages + count)
+
+    initial = info.initial_parameters
+    if params is not None:
+        initial = {k: initial[k] for k in params if k in initial}
+    return {
+        "start_timestamp": int(info.start_timestamp),
+        "last_timestamp": int(info.last_timestamp),
+        "duration_s": (info.last_timestamp - info.start_timestamp) * 1e-6,
+        "topics": topics,
+        "params": {k: float(v) for k, v in initial.items()},
+    }
+
+
+def _scan_or_error(args):
+    """Scan a log in a worker, return the error instead of raising it."""
+    filepath, params = args
+    try:
+        return scan_log(filepath, params)
+    except Exception as e:
+        return e
+
+
+def _find_logs(directory):
+    """Return the paths of all .ulg files below directory."""
+    filepaths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(".ulg"):
+                filepaths.append(os.path.abspath(os.path.join(root, name)))
+    return sorted(filepaths)
+
+
+class ULogIndex:
+    """Index of ulog files in a SQLite database."""
+
+    def __init__(self, path, params=None):
+        """Initialization.
+
+        Arguments:
+        path -- path to the database file, created if it does not exist
+
+        Keyword arguments:
+        params -- list of parameter names to store (default None: all parameters)
+
+        """
+        self.path = path
+        self.params = params
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        """Close the database."""
+        self._db.close()
+
+    def __len__(self):
+        """Return the number of indexed logs."""
+        return self._db.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+    def update(self, directory, workers=None):
+        """Add new and changed logs below a directory, remove deleted logs.
+
+        A log is read again only if its size or modification time changed.
+        Logs that cannot be read are skipped and returned.
+
+        Arguments:
+        directory -- root directory of the ulog files
+
+        Keyword arguments:
+        workers -- number of worker processes (default None: serial)
+
+        Returns the list of updated paths and the dictionary of path to error
+        of the logs that could not be read.
+
+        """
+        root = os.path.join(os.path.abspath(directory), "")
+        stored = {
+            path: (log_id, size, mtime_ns)
+            for log_id, path, size, mtime_ns in self._db.execute(
+                "SELECT id, path, size, mtime_ns FROM logs"
+            )
+            if path.startswith(root)
+        }
+
+        changed = []
+        for filepath in _find_logs(directory):
+            stat = os.stat(filepath)
+            entry = stored.pop(filepath, None)
+            if entry is None or entry[1:] != (stat.st_size, stat.st_mtime_ns):
+                changed.append((filepath, stat))
+
+        args = [(filepath, self.params) for filepath, _ in changed]
+        if not workers or workers <= 1:
+            entries = [_scan_or_error(a) for a in args]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(workers) as ex:
+                entries = list(ex.map(_scan_or_error, args))
+
+        updated = []
+        errors = {}
+        with self._db:
+            self._db.executemany(
+                "DELETE FROM logs WHERE id = ?",
+                [(log_id,) for log_id, _, _ in stored.values()],
+            )
+            for (filepath, stat), entry in zip(changed, entries):
+                self._db.execute(
+                    "DELETE FROM logs WHERE path = ?", (filepath,)
+                )
+                if isinstance(entry, Exception):
+                    errors[filepath] = entry
+                    continue
+                self._insert(filepath, stat, entry)
+                updated.append(filepath)
+        return updated, errors
+
+    def _insert(self, filepath, stat, entry):
+        """Insert the entry of a log."""
+        cursor = self._db.execute(
+            "INSERT INTO logs (path, size, mtime_ns, start_timestamp, "
+            "last_timestamp, duration_s) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                filepath,
+                stat.st_size,
+                stat.st_mtime_ns,
+                entry["start_timestamp"],
+                entry["last_timestamp"],
+                entry["duration_s"],
+            ),
+        )
+        log_id = cursor.lastrowid
+        self._db.executemany(
+            "INSERT INTO topics VALUES (?, ?, ?, ?)",
+            [
+                (log_id, topic, instances, messages)
+                for topic, (instances, messages) in entry["topics"].items()
+            ],
+        )
+        self._db.executemany(
+            "INSERT INTO params VALUES (?, ?, ?)",
+            [(log_id, name, value) for name, value in entry["params"].items()],
+        )
+
+    def query(
+        self,
+        topics=None,
+        min_duration_s=None,
+        max_duration_s=None,
+        params=None,
+    ):
+        """Return the paths of the logs that match all conditions.
+
+        Example: logs with vehicle_global_position that are longer than 10
+        minutes and have MPC_TILTMAX_AIR above 35:
+        index.query(["vehicle_global_position"], 600, params={"MPC_TILTMAX_AIR": (">", 35)})
+
+        Keyword arguments:
+        topics -- list of topics that must have been logged (default None)
+        min_duration_s -- minimal duration in seconds (default None)
+        max_duration_s -- maximal duration in seconds (default None)
+        params -- dictionary of parameter name to (operator, value), with
+                  operator one of <, <=, =, !=, >=, > (default None)
+
+        """
+        conditions = []
+        values = []
+        if min_duration_s is not None:
+            conditions.append("duration_s >= ?")
+            values.append(min_duration_s)
+        if max_duration_s is not None:
+            conditions.append("duration_s <= ?")
+            values.append(max_duration_s)
+        for topic in topics or []:
+            conditions.append(
+                "id IN (SELECT log_id FROM topics WHERE topic = ?)"
+            )
+            values.append(topic)
+        for name, (operator, value) in (params or {}).items():
+            if operator not in _OPERATORS:
+                raise Exception("Unknown operator {:s}".format(operator))
+            conditions.append(
+                "id IN (SELECT log_id FROM params WHERE name = ? AND value "
+                "{:s} ?)".format(operator)
+            )
+            values += [name, value]
+
+        sql = "SELECT path FROM logs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY path"
+        return [path for (path,) in self._db.execute(sql, values)]
+
+    def topics(self, filepath):
+        """Return a dictionary of topic to (instances, messages) of a log.
+
+        Arguments:
+        filepath -- path to .ulg file
+
+        """
+        rows = self._db.execute(
+            "SELECT topic, instances, messages FROM topics JOIN logs "
+            "ON topics.log_id = logs.id WHERE logs.path = ?",
+            (os.path.abspath(filepath),),
+        )
+        return {topic: (inst, msgs) for topic, inst, msgs in rows}
@@ -0,0 +1,118 @@
+"""Store resampled dataframes in Parquet files.
+
+The dataframe is stored with its dtypes, the metadata of the DfUlg object is
+stored as json in the schema metadata of the file. Row groups can be split by
+log time, such that readers that filter on the timestamp only read the row
+groups of the time range. Requires pyarrow.
+
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+
+_META_KEY = b"pyulgresample"
+_PART_FILE = "part-0.parquet"
+
+
+def _pyarrow():
+    """Import pyarrow, which is an optional dependency."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception(
+            "Parquet files require pyarrow: pip install pyarrow"
+        ) from None
+    return pyarrow, pyarrow.parquet
+
+
+def partition_path(path, log_id):
+    """Return the file of a log within a dataset partitioned by log ID.
+
+    The partitions are named log_id=<log_id>, as expected by readers of
+    hive-partitioned datasets.
+
+    Arguments:
+    path -- root directory of the dataset
+    log_id -- ID of the log
+
+    """
+    return os.path.join(path, "log_id={}".format(log_id), _PART_FILE)
+
+
+def _row_groups(timestamps, row_group_s):
+    """Return the row ranges that each cover row_group_s seconds of log time."""
+    if row_group_s is None or len(timestamps) == 0:
+        return [(0, len(timestamps))]
+    step = row_group_s * 1e6
+    bounds = np.arange(timestamps[0], timestamps[-1], step)[1:]
+    splits = np.searchsorted(timestamps, bounds, side="left")
+    edges = np.unique(np.concatenate(([0], splits, [len(timestamps)])))
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def write_frame(path, df, meta, compression="zstd", row_group_s=None):
+    """Write a dataframe with a timestamp column into a Parquet file.
+
+    Arguments:
+    path -- path to the file, missing directories are created
+    df -- dataframe with a timestamp column in microseconds
+    meta -- json-serializable dictionary that is stored with the file
+
+    Keyword arguments:
+    compression -- compression codec of pyarrow, i.e. zstd, snappy or none (default zstd)
+    row_group_s -- seconds of log time per row group (default None: one row group)
+
+    """
+    pa, pq = _pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_META_KEY] = json.dumps(meta, default=str).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    timestamps = df["timestamp"].values
+    with pq.ParquetWriter(path, table.schema, compression=compression) as w:
+        for start, stop in _row_groups(timestamps, row_group_s):
+            w.write_table(
+                table.slice(start, stop - start),
+                row_group_size=max(stop - start, 1),
+            )
+
+
+def read_frame(path, columns=None, start_us=None, end_us=None):
+    """Read a dataframe written with write_frame.
+
+    Only the given columns and the row groups of the time range are read.
+
+    Returns the dataframe, with an index of the timestamps, and the metadata.
+
+    Arguments:
+    path -- path to the file
+
+    Keyword arguments:
+    columns -- list of column names (default None: all columns), the
+               timestamp is always read
+    start_us -- first timestamp in microseconds (default None: start of log)
+    end_us -- last timestamp in microseconds (default None: end of log)
+
+    """
+    _, pq = _pyarrow()
+    if columns is not None and "timestamp" not in columns:
+        columns = ["timestamp"] + list(columns)
+    filters = []
+    if start_us is not None:
+        filters.append(("timestamp", ">=", start_us))
+    if end_us is not None:
+        filters.append(("timestamp", "<=", end_us))
+
+    table = pq.read_table(path, columns=columns, filters=filters or None)
+    meta = json.loads(table.schema.metadata[_META_KEY])
+    df = table.to_pandas()
+    df.index = pd.TimedeltaIndex(
+        df["timestamp"].values.astype(np.int64) * 1000
+    )
+    return df, meta
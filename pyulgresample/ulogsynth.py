@@ -0,0 +1,483 @@
+"""Generate synthetic ulog files for tests and benchmarks.
+
+The logs are random but deterministic for a given seed. They can be created
+in memory, as ulog structures like those of ulogcache, or written to valid
+.ulg files that pyulog parses into the same topics, parameters and dropouts.
+
+"""
+import collections
+import re
+import struct
+import numpy as np
+from pyulgresample import ulogcache
+
+# ulog type -> numpy dtype of the parsed arrays, bool is parsed as int8
+_DTYPES = {
+    "int8_t": np.int8,
+    "uint8_t": np.uint8,
+    "int16_t": np.int16,
+    "uint16_t": np.uint16,
+    "int32_t": np.int32,
+    "uint32_t": np.uint32,
+    "int64_t": np.int64,
+    "uint64_t": np.uint64,
+    "float": np.float32,
+    "double": np.float64,
+    "bool": np.int8,
+    "char": np.int8,
+}
+_TYPES = {
+    np.dtype(dtype): name
+    for name, dtype in reversed(list(_DTYPES.items()))
+    if name not in ("bool", "char")
+}
+
+_ARRAY_FIELD_PATTERN = re.compile(r"^(.+)\[(\d+)\]$")
+_HEADER = b"ULog\x01\x12\x35"
+_FILE_VERSION = 1
+_DEFAULT_FIELDS = [
+    ("float[4]", "q"),
+    ("float", "x"),
+    ("float", "y"),
+    ("float", "z"),
+    ("uint8_t", "mode"),
+]
+
+Dropout = collections.namedtuple("Dropout", ["timestamp", "duration"])
+Dropout.__doc__ = """Dropout of a log, like pyulog.ULog.MessageDropout.
+
+timestamp -- timestamp of the last message before the dropout in microseconds
+duration -- duration in milliseconds
+
+"""
+
+
+class TopicSpec:
+    """Topic of a synthetic log."""
+
+    def __init__(self, name, rate_hz, fields=None, instances=1):
+        """Initialization.
+
+        Arguments:
+        name -- topic name
+        rate_hz -- mean rate of the samples
+
+        Keyword arguments:
+        fields -- list of (type, name) with a ulog type, i.e. ("float[4]", "q")
+                  or ("uint8_t", "mode") (default None: quaternion q, float x, y, z
+                  and uint8_t mode)
+        instances -- number of topic instances (default 1)
+
+        """
+        self.name = name
+        self.rate_hz = rate_hz
+        self.fields = fields or _DEFAULT_FIELDS
+        self.instances = instances
+
+
+class SyntheticULog(ulogcache.CachedULog):
+    """Ulog structure of a synthetic log.
+
+    Provides the members of pyulog.ULog that are used within this package,
+    the dropouts and the ulog types of the fields of each topic.
+
+    """
+
+    def __init__(self, meta, data_list, formats, dropouts):
+        """Initialization.
+
+        Arguments:
+        meta -- dictionary with the log metadata, see ulogcache.ulog_meta
+        data_list -- list of CachedData
+        formats -- dictionary of topic name to list of (type, name) of the fields
+        dropouts -- list of Dropout
+
+        """
+        super().__init__(meta, data_list)
+        self.formats = formats
+        self.dropouts = dropouts
+
+
+def _split_type(type_str):
+    """Return the base type and array size of a ulog type, i.e. float[4]."""
+    if type_str.endswith("]"):
+        base, size = type_str[:-1].split("[")
+        return base, int(size)
+    return type_str, None
+
+
+def _random_field(rng, base, n):
+    """Return n random values of a ulog type."""
+    dtype = np.dtype(_DTYPES[base])
+    if base == "bool":
+        return rng.randint(0, 2, n).astype(dtype)
+    if np.issubdtype(dtype, np.integer):
+        # slowly changing states, i.e. modes and counters
+        return np.cumsum(rng.random_sample(n) < 0.01).astype(dtype) % 8
+    return np.cumsum(rng.normal(size=n)).astype(dtype)
+
+
+def _timestamps(rng, start, end, rate_hz):
+    """Return sorted, unique timestamps with a jittered period."""
+    period = 1e6 / rate_hz
+    n = max(int((end - start) / period), 2)
+    ts = start + (np.arange(n) + rng.uniform(0, 0.5, n)) * period
+    return np.unique(ts.astype(np.uint64))
+
+
+def _drop(data, start, stop):
+    """Remove the samples with start < timestamp <= stop."""
+    keep = (data["timestamp"] <= start) | (data["timestamp"] > stop)
+    return {field: values[keep] for field, values in data.items()}
+
+
+def generate(
+    topics,
+    duration_s=10.0,
+    seed=0,
+    nan_density=0.0,
+    dropouts=0,
+    dropout_ms=100,
+    parameters=None,
+    parameter_changes=0,
+):
+    """Return the ulog structure of a random log.
+
+    Float fields are random walks, integer fields slowly changing states.
+    Float arrays q of size 4 are unit quaternions.
+
+    Arguments:
+    topics -- list of TopicSpec
+
+    Keyword arguments:
+    duration_s -- duration of the log in seconds (default 10)
+    seed -- seed of the random generator (default 0)
+    nan_density -- fraction of NaN-values of float fields (default 0)
+    dropouts -- number of dropouts, during which no topic is logged (default 0)
+    dropout_ms -- duration of each dropout in milliseconds (default 100)
+    parameters -- dictionary of initial parameters, values of type int or
+                  float (default None: a few float and int parameters)
+    parameter_changes -- number of random parameter changes (default 0)
+
+    """
+    rng = np.random.RandomState(seed)
+    start = 1000000
+    end = start + int(duration_s * 1e6)
+    if parameters is None:
+        parameters = {"SYN_GAIN": 0.5, "SYN_MODE": 1, "SYN_RATE": 100.0}
+
+    data_list = []
+    formats = {}
+    for spec in topics:
+        formats[spec.name] = [("uint64_t", "timestamp")] + list(spec.fields)
+        for instance in range(spec.instances):
+            data = {"timestamp": _timestamps(rng, start, end, spec.rate_hz)}
+            n = len(data["timestamp"])
+            for type_str, name in spec.fields:
+                base, size = _split_type(type_str)
+                names = [name]
+                if size is not None:
+                    names = ["{:s}[{:d}]".format(name, i) for i in range(size)]
+                values = [_random_field(rng, base, n) for _ in names]
+                if name == "q" and size == 4:
+                    # attitude quaternions have unit length
+                    norm = np.linalg.norm(np.array(values, np.float64), axis=0)
+                    values = [(v / norm).astype(v.dtype) for v in values]
+                for field, v in zip(names, values):
+                    if nan_density > 0 and v.dtype.kind == "f":
+                        v[rng.random_sample(n) < nan_density] = np.nan
+                    data[field] = v
+            data_list.append(ulogcache.CachedData(spec.name, instance, data))
+
+    all_timestamps = np.unique(
+        np.concatenate([d.data["timestamp"] for d in data_list])
+    )
+
+    # a dropout starts after a logged sample, which is its timestamp
+    dropout_list = []
+    for t in np.sort(rng.choice(all_timestamps, dropouts, replace=False)):
+        if (
+            dropout_list
+            and t <= dropout_list[-1].timestamp + dropout_ms * 1000
+        ):
+            continue
+        dropout_list.append(Dropout(int(t), dropout_ms))
+        for d in data_list:
+            d.data = _drop(d.data, t, t + dropout_ms * 1000)
+
+    # the timestamp of a change is the timestamp of the last logged sample
+    all_timestamps = np.unique(
+        np.concatenate([d.data["timestamp"] for d in data_list])
+    )
+    changes = []
+    names = sorted(parameters)
+    times = np.sort(rng.choice(all_timestamps, parameter_changes))
+    for t in times:
+        name = names[rng.randint(len(names))]
+        value = parameters[name]
+        if isinstance(value, int):
+            value = int(rng.randint(0, 10))
+        else:
+            value = float(np.float32(rng.uniform(0, 10)))
+        changes.append((int(t), name, value))
+
+    meta = {
+        "start_timestamp": start,
+        "last_timestamp": int(all_timestamps[-1]),
+        "initial_parameters": {
+            k: v if isinstance(v, int) else float(np.float32(v))
+            for k, v in parameters.items()
+        },
+        "changed_parameters": changes,
+        "msg_info_dict": {"sys_name": "pyulgresample"},
+    }
+    return SyntheticULog(meta, data_list, formats, dropout_list)
+
+
+def _message(msg_type, payload):
+    """Return a ulog message with header."""
+    return struct.pack("<HB", len(payload), ord(msg_type)) + payload
+
+
+def _key_value(type_str, name, value):
+    """Return the payload of an info or parameter message."""
+    key = "{:s} {:s}".format(type_str, name).encode()
+    return struct.pack("<B", len(key)) + key + value
+
+
+def _parameter(name, value):
+    """Return a parameter message, ulog parameters are int32 or float."""
+    if isinstance(value, (int, np.integer)):
+        return _message(
+            "P", _key_value("int32_t", name, struct.pack("<i", value))
+        )
+    return _message("P", _key_value("float", name, struct.pack("<f", value)))
+
+
+def _message_formats(ulog):
+    """Return a dictionary of format name to list of (type, name).
+
+    The formats of a synthetic log are taken as they are. For a log parsed
+    by pyulog, they are taken from its message formats, which include the
+    nested types and padding fields.
+
+    """
+    formats = dict(getattr(ulog, "formats", {}))
+    for name, message_format in getattr(ulog, "message_formats", {}).items():
+        fields = []
+        for type_str, size, field in message_format.fields:
+            if size:
+                type_str = "{:s}[{:d}]".format(type_str, size)
+            fields.append((type_str, field))
+        formats.setdefault(name, fields)
+    return formats
+
+
+def _infer_fields(msg):
+    """Return the list of (type, name) of a topic from its parsed fields.
+
+    Only basic fields and arrays of them can be inferred, nested types
+    require the message formats of the log.
+
+    """
+    fields = []
+    for field, values in msg.data.items():
+        match = _ARRAY_FIELD_PATTERN.match(field)
+        name = match.group(1) if match else field
+        if "[" in name or "." in name:
+            raise Exception(
+                "Field {:s} of {:s} is nested, which requires the message "
+                "formats of the log".format(field, msg.name)
+            )
+        if not match:
+            fields.append((_TYPES[values.dtype], field))
+        elif match.group(2) == "0":
+            size = sum(1 for f in msg.data if f.startswith(name + "["))
+            type_str = "{:s}[{:d}]".format(_TYPES[values.dtype], size)
+            fields.append((type_str, name))
+    fields.sort(key=lambda f: f[1] != "timestamp")
+    return fields
+
+
+def _nested_types(formats, fields):
+    """Return the names of the nested types used by fields, recursively."""
+    nested = []
+    for type_str, name in fields:
+        base, _ = _split_type(type_str)
+        if base in _DTYPES:
+            continue
+        if base not in formats:
+            raise Exception(
+                "Unknown type {:s} of field {:s}".format(base, name)
+            )
+        for nested_type in [base] + _nested_types(formats, formats[base]):
+            if nested_type not in nested:
+                nested.append(nested_type)
+    return nested
+
+
+def _flat_fields(formats, fields, prefix=""):
+    """Return the (name, type) of the basic fields in the order of the bytes.
+
+    Nested types are flattened and named as pyulog names them, i.e.
+    esc[0].esc_rpm.
+
+    """
+    flat = []
+    for type_str, name in fields:
+        base, size = _split_type(type_str)
+        names = [prefix + name]
+        if size is not None:
+            names = [
+                "{:s}{:s}[{:d}]".format(prefix, name, i) for i in range(size)
+            ]
+        for field in names:
+            if base in _DTYPES:
+                flat.append((field, base))
+            else:
+                flat += _flat_fields(formats, formats[base], field + ".")
+    return flat
+
+
+def _is_padding(name):
+    """Return True for a padding field, i.e. esc[0]._padding0[1]."""
+    return name.split(".")[-1].startswith("_padding")
+
+
+def _records(msg, flat, msg_id):
+    """Return the data messages of a topic instance as (n, size) uint8 array.
+
+    Padding fields, which pyulog can leave out of the data, are zero.
+
+    """
+    columns = [
+        (name, np.dtype(_DTYPES[base]).newbyteorder("<"))
+        for name, base in flat
+    ]
+
+    # message header, named such that it cannot clash with field names
+    header = [(" size", "<u2"), (" type", "u1"), (" msg_id", "<u2")]
+    n = len(msg.data["timestamp"])
+    records = np.zeros(n, dtype=np.dtype(header + columns))
+    records[" size"] = records.dtype.itemsize - 3
+    records[" type"] = ord("D")
+    records[" msg_id"] = msg_id
+    for name, _ in columns:
+        if name in msg.data:
+            records[name] = msg.data[name]
+        elif not _is_padding(name):
+            raise Exception(
+                "Topic {:s} has no field {:s}".format(msg.name, name)
+            )
+    return records.view(np.uint8).reshape(n, records.dtype.itemsize)
+
+
+def write_ulog(filepath, ulog):
+    """Write a ulog structure into a .ulg file.
+
+    Writes the topics, the initial and changed parameters, the info messages
+    and the dropouts, if the ulog structure has them. The data messages are
+    ordered by timestamp. A parameter change or dropout is written after the
+    data messages up to its timestamp, which is the timestamp pyulog assigns
+    to it. The layout of the topics is taken from the formats of a synthetic
+    log or the message formats of a log parsed by pyulog, including nested
+    types. Without them, only basic fields and arrays can be written.
+
+    Arguments:
+    filepath -- path to the .ulg file
+    ulog -- ulog structure, i.e. from generate or pyulog
+
+    """
+    definitions = [
+        _message("B", bytes(8 + 8 + 3 * 8)),
+    ]
+    for key, value in ulog.msg_info_dict.items():
+        if isinstance(value, str):
+            raw = value.encode()
+            definitions.append(
+                _message(
+                    "I", _key_value("char[{:d}]".format(len(raw)), key, raw)
+                )
+            )
+    message_formats = _message_formats(ulog)
+    topic_formats = {}
+    for msg in ulog.data_list:
+        if msg.name not in topic_formats:
+            topic_formats[msg.name] = message_formats.get(
+                msg.name
+            ) or _infer_fields(msg)
+    # the nested types of the topics are defined as well
+    formats = {}
+    for fields in topic_formats.values():
+        for name in _nested_types(message_formats, fields):
+            formats[name] = message_formats[name]
+    formats.update(topic_formats)
+    for name, fields in formats.items():
+        spec = "{:s}:".format(name) + "".join(
+            "{:s} {:s};".format(t, f) for t, f in fields
+        )
+        definitions.append(_message("F", spec.encode()))
+    for name, value in ulog.initial_parameters.items():
+        definitions.append(_parameter(name, value))
+
+    # messages of the data section as (timestamp, kind, bytes) blocks,
+    # data messages (kind 0) come before other messages of the same time
+    blocks = []
+    subscriptions = []
+    for msg_id, msg in enumerate(ulog.data_list):
+        subscriptions.append(
+            _message(
+                "A",
+                struct.pack("<BH", msg.multi_id, msg_id) + msg.name.encode(),
+            )
+        )
+        flat = _flat_fields(formats, formats[msg.name])
+        # pyulog expects the messages without the padding at the end
+        while flat and _is_padding(flat[-1][0]):
+            flat.pop()
+        records = _records(msg, flat, msg_id)
+        blocks.append((msg.data["timestamp"], 0, records))
+    others = [
+        (t, _parameter(name, value))
+        for t, name, value in ulog.changed_parameters
+    ]
+    others += [
+        (d.timestamp, _message("O", struct.pack("<H", d.duration)))
+        for d in getattr(ulog, "dropouts", [])
+    ]
+
+    # order all data messages by timestamp and scatter them into one buffer
+    timestamps = np.concatenate(
+        [b[0] for b in blocks] + [np.array([t for t, _ in others], np.uint64)]
+    )
+    kinds = np.concatenate(
+        [np.zeros(len(b[0]), np.uint8) for b in blocks]
+        + [np.ones(len(others), np.uint8)]
+    )
+    sizes = np.concatenate(
+        [np.full(len(b[0]), b[2].shape[1]) for b in blocks]
+        + [np.array([len(m) for _, m in others], np.int64)]
+    )
+    order = np.lexsort((kinds, timestamps))
+    offsets = np.empty(len(order), dtype=np.int64)
+    offsets[order] = np.concatenate(([0], np.cumsum(sizes[order])[:-1]))
+    buf = np.empty(int(sizes.sum()), dtype=np.uint8)
+
+    pos = 0
+    for _, _, records in blocks:
+        n, size = records.shape
+        index = offsets[pos : pos + n, None] + np.arange(size)
+        buf[index] = records
+        pos += n
+    for _, message in others:
+        buf[offsets[pos] : offsets[pos] + len(message)] = np.frombuffer(
+            message, np.uint8
+        )
+        pos += 1
+
+    with open(filepath, "wb") as f:
+        f.write(_HEADER)
+        f.write(struct.pack("<BQ", _FILE_VERSION, int(ulog.start_timestamp)))
+        for message in definitions + subscriptions:
+            f.write(message)
+        f.write(buf.tobytes())
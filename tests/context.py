@@ -11,3 +11,8 @@ from pyulgresample.ulogdataframe import DfUlg
 from pyulgresample.ulogdataframe import TopicMsgs
 from pyulgresample import mathpandas
 from pyulgresample import loginfo
+from pyulgresample import ulogcache
+from pyulgresample import ulogindex
+from pyulgresample import cli
+from pyulgresample import benchmark
+from pyulgresample import ulogsynth
@@ -0,0 +1,49 @@
+"""test_benchmark."""
+from context import benchmark
+import copy
+
+
+def test_benchmark():
+    """test a small benchmark run and the comparison with a baseline."""
+    results = benchmark.run(
+        ["testlogs/position.ulg"], rows=[1000], topics=[3], repeat=1
+    )
+    assert sorted(results["cases"]) == [
+        "synthetic_1000rows_3topics",
+        "testlogs/position.ulg",
+    ]
+    stages = results["cases"]["synthetic_1000rows_3topics"]
+    assert "merge_pandadict" in stages
+    assert "series_quat2euler" in stages
+    assert all(s["peak_bytes"] > 0 for s in stages.values())
+    assert benchmark.compare(results, results) == []
+
+    baseline = copy.deepcopy(results)
+    stage = baseline["cases"]["testlogs/position.ulg"]["merge_pandadict"]
+    stage["time_s"] /= 2
+    stage["peak_bytes"] /= 2
+    regressions = benchmark.compare(results, baseline, threshold=0.5)
+    assert [r[2] for r in regressions] == ["time_s", "peak_bytes"]
+    assert benchmark.compare(results, baseline, 0.5, 1.5)[0][2] == "time_s"
+
+
+def test_synthetic_ulog():
+    """test size of the synthetic logs."""
+    ulog = benchmark.synthetic_ulog(10000, 5)
+    assert len(ulog.data_list) == 5
+    n = sum(len(d.data["timestamp"]) for d in ulog.data_list)
+    assert 9000 < n <= 10000
+
+
+def test_stages_hold_integer_fields():
+    """test that repeated merge and resample runs hold integer fields."""
+    stages = {
+        name: (setup, run)
+        for name, setup, run in benchmark._stages("testlogs/position.ulg")
+    }
+    for name in ["merge_pandadict_interpolate", "resample_pandadict"]:
+        setup, run = stages[name]
+        for _ in range(2):
+            df = run(setup())
+        nav_state = df["T_vehicle_status_0__F_nav_state"].dropna()
+        assert (nav_state % 1 == 0).all()
@@ -0,0 +1,72 @@
+"""test_cli."""
+from context import cli
+from context import DfUlg
+import os
+import shutil
+import pytest
+
+
+def test_convert(tmpdir, capsys):
+    """test conversion of a directory and skipping of unchanged files."""
+    pytest.importorskip("pyarrow")
+    logs = os.path.join(str(tmpdir), "logs")
+    os.makedirs(os.path.join(logs, "sub"))
+    shutil.copy("testlogs/position.ulg", logs)
+    shutil.copy("testlogs/parameterchange.ulg", os.path.join(logs, "sub"))
+    with open(os.path.join(logs, "broken.ulg"), "w") as f:
+        f.write("no ulog")
+    out = os.path.join(str(tmpdir), "out")
+
+    argv = [logs, "-o", out, "-t", "vehicle_local_position:x,y,z"]
+    argv += ["--rate-hz", "10", "-j", "2"]
+    assert cli.main(argv) == 1
+    stdout = capsys.readouterr().out
+    assert "2 converted, 0 skipped, 1 failed" in stdout
+    assert "rows/s" in stdout
+
+    dfulg = DfUlg.load(os.path.join(out, "sub", "parameterchange.parquet"))
+    assert dfulg.get_columns("vehicle_local_position") == [
+        "T_vehicle_local_position_0__F_x",
+        "T_vehicle_local_position_0__F_y",
+        "T_vehicle_local_position_0__F_z",
+    ]
+    assert sorted(os.listdir(out)) == ["position.parquet", "sub"]
+
+    # only the file that failed is converted again
+    os.remove(os.path.join(logs, "broken.ulg"))
+    assert cli.main(argv) == 0
+    assert "0 converted, 2 skipped, 0 failed" in capsys.readouterr().out
+
+
+def test_find_inputs(tmpdir, capsys):
+    """test output paths of globs and refusing clashing outputs."""
+    logs = str(tmpdir)
+    for sub in ["a", "b"]:
+        os.makedirs(os.path.join(logs, sub))
+        shutil.copy("testlogs/position.ulg", os.path.join(logs, sub, "x.ulg"))
+
+    inputs = cli.find_inputs([os.path.join(logs, "*", "x.ulg")])
+    assert [relpath for _, relpath in inputs] == [
+        os.path.join("a", "x.ulg"),
+        os.path.join("b", "x.ulg"),
+    ]
+
+    argv = [os.path.join(logs, "a", "x.ulg"), os.path.join(logs, "b", "x.ulg")]
+    with pytest.raises(SystemExit):
+        cli.main(argv + ["-o", os.path.join(logs, "out")])
+    assert "same output" in capsys.readouterr().err
+    assert not os.path.exists(os.path.join(logs, "out"))
+
+
+def test_convert_zoh_topic(tmpdir, capsys):
+    """test zero-order-hold of all msgs of a topic."""
+    pytest.importorskip("pyarrow")
+    out = str(tmpdir)
+    argv = ["testlogs/position.ulg", "-o", out, "-t", "vehicle_status"]
+    argv += ["--zoh", "vehicle_status", "--rate-hz", "10"]
+    assert cli.main(argv) == 0
+    assert "1 converted" in capsys.readouterr().out
+
+    dfulg = DfUlg.load(os.path.join(out, "position.parquet"))
+    nav_state = dfulg.df["T_vehicle_status_0__F_nav_state"].dropna()
+    assert (nav_state % 1 == 0).all()
@@ -1,7 +1,9 @@
 """test_loginfo."""
 from context import loginfo
 from context import DfUlg
+from context import TopicMsgs
 import pytest
+import pyulog
 import warnings
 from numpy.testing import assert_almost_equal
 
@@ -42,6 +44,33 @@ def test_get_ulog():
     assert ulog.data_list is not None
 
 
+def test_get_ulog_projection():
+    """test that only the selected msgs are kept."""
+    file = "testlogs/position.ulg"
+    topics = [
+        TopicMsgs("vehicle_attitude", ["q", "rollspeed"]),
+        "vehicle_status",
+    ]
+    ulog = loginfo.get_ulog(file, topics)
+    attitude = ulog.get_dataset("vehicle_attitude").data
+    assert sorted(attitude) == [
+        "q[0]",
+        "q[1]",
+        "q[2]",
+        "q[3]",
+        "rollspeed",
+        "timestamp",
+    ]
+    full = loginfo.get_ulog(file, ["vehicle_status"])
+    assert (
+        ulog.get_dataset("vehicle_status").data.keys()
+        == full.get_dataset("vehicle_status").data.keys()
+    )
+
+    with pytest.warns(UserWarning):
+        loginfo.get_ulog(file, [TopicMsgs("vehicle_attitude", ["q", "vv"])])
+
+
 def test_ulog_getters():
     """test simple getters."""
     file = "testlogs/position.ulg"
@@ -100,3 +129,95 @@ def test_add_parameter():
 
     # between 54 to then end, MPC_YAW_MODE equal 0
     assert all(lm.df[(lm.df["timestamp"] * 1e-6 > 54.1)]["MPC_YAW_MODE"] == 0)
+
+
+def test_param_timeline():
+    """test parameter values at arbitrary timestamps."""
+    file = "testlogs/parameterchange.ulg"
+    lm = DfUlg.create(filepath=file, topics=["vehicle_local_position"])
+    timeline = loginfo.get_param_timeline(lm.ulog)
+    assert loginfo.get_param_timeline(lm.ulog) is timeline
+
+    # MPC_YAW_MODE changes to 1, 3 and 0, see test_add_parameter
+    values = timeline.value_at("MPC_YAW_MODE", [40e6, 50e6, 60e6])
+    assert list(values) == [1, 3, 0]
+    assert (
+        timeline.value_at("MPC_YAW_MODE", 0)
+        == lm.ulog.initial_parameters["MPC_YAW_MODE"]
+    )
+    assert timeline.value_at("vv", 50e6, default=2) == 2
+
+    # several parameters at once give the same columns
+    loginfo.add_param(lm, ["MPC_YAW_MODE", "MPC_XY_P"])
+    assert all(
+        lm.df["MPC_YAW_MODE"]
+        == timeline.value_at("MPC_YAW_MODE", lm.df["timestamp"].values)
+    )
+    assert lm.df["MPC_XY_P"].nunique() == 1
+
+
+def test_param_history():
+    """test the history of all parameters."""
+    file = "testlogs/parameterchange.ulg"
+    lm = DfUlg.create(filepath=file, topics=["vehicle_local_position"])
+    history = loginfo.get_param_history(lm.ulog)
+    assert loginfo.get_param_history(lm.ulog) is history
+    assert len(history) == len(
+        {t for t, _, _ in lm.ulog.changed_parameters} | {0}
+    )
+    assert set(lm.ulog.initial_parameters) <= set(history.columns)
+
+    params = loginfo.align_params(lm)
+    assert (params.index == lm.df.index).all()
+    loginfo.add_param(lm, ["MPC_YAW_MODE", "MPC_YAW_EXPO", "MPC_XY_P"])
+    for name in ["MPC_YAW_MODE", "MPC_YAW_EXPO", "MPC_XY_P"]:
+        assert_almost_equal(params[name].values, lm.df[name].values)
+
+    with pytest.warns(UserWarning):
+        params = loginfo.align_params(lm, ["MPC_XY_P", "vv"])
+    assert list(params.columns) == ["MPC_XY_P"]
+
+
+def test_get_ulog_info():
+    """test that the metadata matches the parsed ulog."""
+    for file in ["testlogs/position.ulg", "testlogs/parameterchange.ulg"]:
+        ulog = loginfo.get_ulog(file)
+        # small tails have to be extended to find the last data message
+        for tail_bytes in [100, 1 << 16, 1 << 30]:
+            info = loginfo.get_ulog_info(file, tail_bytes)
+            assert info.start_timestamp == ulog.start_timestamp
+            assert info.last_timestamp == ulog.last_timestamp
+            assert info.initial_parameters == ulog.initial_parameters
+        assert loginfo.get_duration(info) == loginfo.get_duration(ulog)
+        assert loginfo.get_param(info, "MPC_XY_P", 0) == loginfo.get_param(
+            ulog, "MPC_XY_P", 0
+        )
+
+
+def test_get_message_counts(tmpdir):
+    """test message counts against the parsed ulog."""
+    file = "testlogs/position.ulg"
+    ulog = loginfo.get_ulog(file)
+    counts = loginfo.get_message_counts(file)
+    assert counts == {
+        (d.name, d.multi_id): len(d.data["timestamp"]) for d in ulog.data_list
+    }
+
+    # a file with only a header has no messages
+    empty = str(tmpdir.join("empty.ulg"))
+    with open(file, "rb") as src, open(empty, "wb") as dst:
+        dst.write(src.read(16))
+    assert loginfo.get_message_counts(empty) == {}
+
+
+def test_get_message_counts_corrupt(tmpdir):
+    """test that counting ends on a file with a damaged sync message."""
+    file = "testlogs/position.ulg"
+    with open(file, "rb") as f:
+        header = f.read(16)
+    corrupt = str(tmpdir.join("corrupt.ulg"))
+    with open(corrupt, "wb") as f:
+        # message with an invalid type, then a sync with a damaged header
+        f.write(header + b"\x01\x00\xff\x00")
+        f.write(b"\xff\xff\xff" + pyulog.ULog.SYNC_BYTES)
+    assert loginfo.get_message_counts(corrupt) == {}
@@ -1,7 +1,9 @@
 """test_ulogconv."""
 from context import mathpandas as mpd
+from context import DfUlg
 import pandas as pd
 import numpy as np
+import time
 from numpy.testing import assert_almost_equal
 
 
@@ -73,3 +75,252 @@ def test_heading_from_2d():
     heading = mpd.get_heading_from_2d_vector(n, e)
     print(heading)
     assert_almost_equal(heading, [0.78539816339])
+
+
+def _reference_quat2euler(q0, q1, q2, q3):
+    """Per-sample euler angles computed with transforms3d."""
+    import transforms3d.taitbryan as tf
+
+    return np.array(
+        [
+            tf.quat2euler([q0i, q1i, q2i, q3i])
+            for q0i, q1i, q2i, q3i in zip(q0, q1, q2, q3)
+        ]
+    ).T
+
+
+def _reference_quatrot(x, y, z, q0, q1, q2, q3):
+    """Per-sample vector rotation computed with transforms3d."""
+    import transforms3d.quaternions as quat
+
+    return np.array(
+        [
+            quat.rotate_vector([xi, yi, zi], [q0i, q1i, q2i, q3i])
+            for xi, yi, zi, q0i, q1i, q2i, q3i in zip(x, y, z, q0, q1, q2, q3)
+        ]
+    ).T
+
+
+def _attitude():
+    """Return the attitude quaternion of the position test log."""
+    lm = DfUlg.create("testlogs/position.ulg", topics=["vehicle_attitude"])
+    return [
+        lm.df["T_vehicle_attitude_0__F_q_{:d}".format(i)] for i in range(4)
+    ]
+
+
+def test_quat2euler():
+    """test vectorized euler angles against transforms3d."""
+    q = _attitude()
+    roll, pitch, yaw = mpd.get_series_quat2euler(*q, msg_name="att")
+    yaw_ref, pitch_ref, roll_ref = _reference_quat2euler(*q)
+
+    assert_almost_equal(roll.values, roll_ref)
+    assert_almost_equal(pitch.values, pitch_ref)
+    assert_almost_equal(yaw.values, yaw_ref)
+    assert roll.name == "att_roll"
+    assert yaw.index.equals(q[0].index)
+
+    # gimbal lock and zero quaternion
+    q0 = pd.Series([np.sqrt(0.5), 0.0, 1.0])
+    q1 = pd.Series([0.0, 0.0, 0.0])
+    q2 = pd.Series([np.sqrt(0.5), 0.0, 0.0])
+    q3 = pd.Series([0.0, 0.0, 0.0])
+    roll, pitch, yaw = mpd.get_series_quat2euler(q0, q1, q2, q3)
+    yaw_ref, pitch_ref, roll_ref = _reference_quat2euler(q0, q1, q2, q3)
+    assert_almost_equal(roll.values, roll_ref)
+    assert_almost_equal(pitch.values, pitch_ref)
+    assert_almost_equal(yaw.values, yaw_ref)
+
+
+def test_quatrot():
+    """test vectorized rotation against transforms3d."""
+    q = _attitude()
+    rng = np.random.RandomState(0)
+    x, y, z = [
+        pd.Series(rng.randn(q[0].shape[0]), index=q[0].index) for _ in range(3)
+    ]
+
+    x_r, y_r, z_r = mpd.get_series_quatrot(x, y, z, *q, msg_name="rot")
+    assert_almost_equal(
+        np.array([x_r, y_r, z_r]), _reference_quatrot(x, y, z, *q)
+    )
+    assert x_r.name == "rot_x"
+
+    x_r, y_r, z_r = mpd.get_series_quatrot_inverse(x, y, z, *q)
+    q_inv = [q[0], -q[1], -q[2], -q[3]]
+    assert_almost_equal(
+        np.array([x_r, y_r, z_r]), _reference_quatrot(x, y, z, *q_inv)
+    )
+
+
+def test_quat_benchmark():
+    """vectorized quaternion kernels are faster than per-sample calls."""
+    q = _attitude()
+    x, y, z = [pd.Series(np.ones(q[0].shape[0]), index=q[0].index)] * 3
+
+    start = time.perf_counter()
+    _reference_quat2euler(*q)
+    _reference_quatrot(x, y, z, *q)
+    reference = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mpd.get_series_quat2euler(*q)
+    mpd.get_series_quatrot(x, y, z, *q)
+    vectorized = time.perf_counter() - start
+
+    print(
+        "quaternion kernels: {:.4f}s -> {:.4f}s ({:.0f}x)".format(
+            reference, vectorized, reference / vectorized
+        )
+    )
+    assert vectorized < reference
+
+
+def _reference_dot(x0, y0, z0, x1, y1, z1):
+    """Per-sample dot product."""
+    return np.array(
+        [
+            np.dot([x0i, y0i, z0i], [x1i, y1i, z1i])
+            for x0i, y0i, z0i, x1i, y1i, z1i in zip(x0, y0, z0, x1, y1, z1)
+        ]
+    )
+
+
+def _reference_norm_2d(x0, y0):
+    """Per-sample 2d norm."""
+    return np.array(
+        [np.linalg.norm([x0i, y0i], axis=0) for x0i, y0i in zip(x0, y0)]
+    )
+
+
+def _reference_tilt(q0, q1, q2, q3):
+    """Per-sample tilt through the rotated z axis."""
+    zeros = np.zeros(q0.shape[0])
+    ones = np.ones(q0.shape[0])
+    x, y, z = _reference_quatrot(zeros, zeros, ones, q0, q1, q2, q3)
+    dot = _reference_dot(zeros, zeros, ones, x, y, z)
+    return np.arccos(np.where(dot < 1, dot, 1))
+
+
+def _reference_heading(north, east):
+    """Heading through the per-sample norm."""
+    norm = _reference_norm_2d(north, east)
+    norm[norm <= np.finfo(np.float64).eps] = np.finfo(np.float64).eps
+    return np.sign(east / norm) * mpd.angle_wrap_pi(np.arccos(north / norm))
+
+
+def _random_series(n, count, seed=0):
+    """Return count random pandas series of length n."""
+    rng = np.random.RandomState(seed)
+    return [pd.Series(rng.randn(n)) for _ in range(count)]
+
+
+def test_vector_helpers():
+    """test dot, norm, tilt and heading against per-sample computation."""
+    x0, y0, z0, x1, y1, z1 = _random_series(1000, 6)
+
+    dot = mpd.get_series_dot(x0, y0, z0, x1, y1, z1, "test")
+    assert_almost_equal(dot.values, _reference_dot(x0, y0, z0, x1, y1, z1))
+    assert dot.name == "test_dot"
+
+    norm = mpd.get_series_norm_2d(x0, y0)
+    assert_almost_equal(norm.values, _reference_norm_2d(x0, y0))
+
+    # include the degenerate zero vector and the cardinal directions
+    north = pd.concat([x0, pd.Series([0.0, 1.0, -1.0, 0.0, 0.0])])
+    east = pd.concat([y0, pd.Series([0.0, 0.0, 0.0, 1.0, -1.0])])
+    heading = mpd.get_heading_from_2d_vector(north, east)
+    assert_almost_equal(heading.values, _reference_heading(north, east))
+
+    q = _attitude()
+    tilt = mpd.get_tilt_from_attitude(*q)
+    assert_almost_equal(tilt.values, _reference_tilt(*q))
+
+    x, y, z = mpd.get_z_axis_from_attitude(*q, msg_name="body")
+    x_ref, y_ref, z_ref = _reference_quatrot(
+        np.zeros(q[0].shape[0]),
+        np.zeros(q[0].shape[0]),
+        np.ones(q[0].shape[0]),
+        *q
+    )
+    assert_almost_equal(x.values, x_ref)
+    assert_almost_equal(y.values, y_ref)
+    assert_almost_equal(z.values, z_ref)
+    assert x.name == "body_z_axis_x"
+
+
+def test_vector_helpers_benchmark():
+    """micro-benchmark of the vector helpers at 10^6 rows.
+
+    The per-sample reference is timed on a slice and scaled to the full
+    length, since running it on 10^6 rows takes several seconds.
+    """
+    n = 1000000
+    n_ref = 10000
+    x0, y0, z0, x1, y1, z1 = _random_series(n, 6)
+    q = _random_series(n, 4)
+
+    start = time.perf_counter()
+    mpd.get_series_dot(x0, y0, z0, x1, y1, z1)
+    mpd.get_series_norm_2d(x0, y0)
+    mpd.get_tilt_from_attitude(*q)
+    mpd.get_heading_from_2d_vector(x0, y0)
+    vectorized = time.perf_counter() - start
+
+    x0, y0, z0, x1, y1, z1 = [s[:n_ref] for s in (x0, y0, z0, x1, y1, z1)]
+    q = [s[:n_ref] for s in q]
+    start = time.perf_counter()
+    _reference_dot(x0, y0, z0, x1, y1, z1)
+    _reference_norm_2d(x0, y0)
+    _reference_tilt(*q)
+    _reference_heading(x0, y0)
+    reference = (time.perf_counter() - start) * n / n_ref
+
+    print(
+        "vector helpers at 10^6 rows: {:.2f}s -> {:.4f}s ({:.0f}x)".format(
+            reference, vectorized, reference / vectorized
+        )
+    )
+    assert vectorized < reference
+
+
+def test_utm():
+    """test vectorized utm conversion against per-sample conversion."""
+    import utm
+
+    # track that crosses zones 31/32, the norway exception and the equator
+    lat = pd.Series(
+        np.concatenate(
+            [
+                np.linspace(47.0, 47.1, 50),
+                np.linspace(58.0, 58.1, 50),
+                np.linspace(0.05, -0.05, 50),
+                [np.nan, 47.0],
+            ]
+        )
+    )
+    lon = pd.Series(
+        np.concatenate(
+            [
+                np.linspace(5.9, 6.1, 50),
+                np.linspace(2.9, 3.1, 50),
+                np.linspace(-0.1, 0.1, 50),
+                [8.0, np.nan],
+            ]
+        )
+    )
+
+    easting, northing, zone = mpd.get_series_utm(lat, lon, "gps")
+    assert easting.name == "gps_easting"
+    assert zone.dtype == np.float64
+
+    for i in range(lat.shape[0] - 2):
+        e, n, z, _ = utm.from_latlon(lat[i], lon[i])
+        assert_almost_equal(easting[i], e, decimal=5)
+        assert_almost_equal(northing[i], n, decimal=5)
+        assert zone[i] == z
+
+    assert np.isnan(easting.iloc[-2:]).all()
+    assert np.isnan(zone.iloc[-2:]).all()
+    assert set(zone.dropna()) == {30, 31, 32}
@@ -0,0 +1,104 @@
+"""test_ulogcache."""
+from context import ulogcache
+from context import loginfo
+from context import DfUlg
+import os
+import pyulog
+from numpy.testing import assert_almost_equal
+
+
+def test_cache_roundtrip(tmpdir):
+    """test that cached topics are identical to parsed topics."""
+    file = "testlogs/position.ulg"
+    topics = ["vehicle_local_position", "vehicle_attitude"]
+    cache = ulogcache.ULogCache(str(tmpdir))
+
+    assert cache.load(file, topics) is None
+    ulog = loginfo.get_ulog(file, topics, cache)
+    assert isinstance(ulog, pyulog.ULog)
+
+    cached = cache.load(file, topics)
+    assert cached is not None
+    assert cached.start_timestamp == ulog.start_timestamp
+    assert cached.last_timestamp == ulog.last_timestamp
+    assert cached.initial_parameters == ulog.initial_parameters
+    assert len(cached.data_list) == len(ulog.data_list)
+    for msg, cached_msg in zip(ulog.data_list, cached.data_list):
+        assert msg.name == cached_msg.name
+        assert msg.multi_id == cached_msg.multi_id
+        assert list(msg.data.keys()) == list(cached_msg.data.keys())
+        for field in msg.data:
+            assert msg.data[field].dtype == cached_msg.data[field].dtype
+            assert_almost_equal(msg.data[field], cached_msg.data[field])
+
+    # different topic lists are different entries
+    assert cache.load(file, ["vehicle_attitude"]) is None
+    assert cache.load(file) is None
+
+
+def test_cache_warm_load_skips_parsing(tmpdir, monkeypatch):
+    """test that a warm load does not parse the file."""
+    file = "testlogs/position.ulg"
+    topics = ["vehicle_attitude"]
+    cache = ulogcache.ULogCache(str(tmpdir))
+    expected = DfUlg.create(file, topics=topics, cache=cache)
+
+    def no_parsing(*args, **kwargs):
+        raise AssertionError("file is parsed")
+
+    monkeypatch.setattr(pyulog, "ULog", no_parsing)
+    lm = DfUlg.create(file, topics=topics, cache=cache)
+    assert_almost_equal(lm.df.values, expected.df.values)
+
+    # changing the cached arrays does not change the cache
+    lm.ulog.data_list[0].data["q[0]"][:] = 0
+    ulog = cache.load(file, topics)
+    assert_almost_equal(
+        ulog.data_list[0].data["q[0]"],
+        expected.ulog.data_list[0].data["q[0]"],
+    )
+
+
+def test_cache_eviction(tmpdir):
+    """test that least recently used entries are evicted."""
+    file = "testlogs/position.ulg"
+    cache = ulogcache.ULogCache(str(tmpdir))
+    loginfo.get_ulog(file, ["vehicle_attitude"], cache)
+    loginfo.get_ulog(file, ["vehicle_local_position"], cache)
+    sizes = {entry: size for _, size, entry in cache.entries()}
+    assert len(sizes) == 2
+
+    # make the second entry the least recently used one
+    key = cache.key(file, ["vehicle_local_position"])
+    os.utime(os.path.join(str(tmpdir), key, "meta.json"), (0, 0))
+    cache.max_bytes = max(sizes.values())
+    cache.evict()
+    assert cache.load(file, ["vehicle_attitude"]) is not None
+    assert cache.load(file, ["vehicle_local_position"]) is None
+
+    cache.clear()
+    assert cache.entries() == []
+
+
+def test_frame_roundtrip(tmpdir):
+    """test storing a compact dataframe with nullable columns."""
+    lm = DfUlg.create(
+        "testlogs/position.ulg",
+        topics=["vehicle_attitude", "vehicle_status"],
+        compact=True,
+    )
+    ulogcache.save_frame(str(tmpdir), lm.df)
+    df = ulogcache.load_frame(str(tmpdir))
+
+    assert list(df.dtypes) == list(lm.df.dtypes)
+    assert df.index.equals(lm.df.index)
+    for col in lm.df.columns:
+        assert df[col].equals(lm.df[col])
+
+
+def test_cache_expands_home(tmpdir, monkeypatch):
+    """test that ~ in the cache directory is the home directory."""
+    monkeypatch.setenv("HOME", str(tmpdir))
+    cache = ulogcache.ULogCache("~/cache")
+    assert cache.directory == os.path.join(str(tmpdir), "cache")
+    assert os.path.isdir(cache.directory)
@@ -4,6 +4,7 @@ from context import TopicMsgs
 import pyulog
 import pandas as pd
 import numpy as np
+import time
 from numpy.testing import assert_almost_equal
 
 
@@ -28,6 +29,24 @@ def test_createPandaDict():
                 assert name[:2] == "F_"
 
 
+def test_createPandaDict_no_copy():
+    """test that topic dataframes and renames do not copy the ulog arrays."""
+    file = "testlogs/position.ulg"
+    ulog = pyulog.ULog(file, ["vehicle_attitude"])
+    data = ulog.data_list[0].data
+
+    dp = ulogconv.create_pandadict(ulog)
+    df = dp["T_vehicle_attitude_0"]
+    assert np.shares_memory(df["F_q_0"].values, data["q[0]"])
+    assert np.shares_memory(df["timestamp"].values, data["timestamp"])
+
+    ulogconv.combine_topic_fieldname(dp)
+    df = dp["T_vehicle_attitude_0"]
+    assert np.shares_memory(
+        df["T_vehicle_attitude_0__F_q_0"].values, data["q[0]"]
+    )
+
+
 def test_apply_zoh():
     """test zoh."""
     # zoh to msg_2
@@ -97,6 +116,45 @@ def test_apply_zoh():
     ulogconv.apply_zoh(df, topicMsgsList)
     assert_almost_equal(msg_5_expected, df.T_topic_1_0__F_msg_5)
 
+    # zoh to msg_2 does not touch other msgs or topics
+    df = pd.DataFrame(
+        {
+            "T_topic_1_0__F_msg_2": msg2,
+            "T_topic_1_0__F_msg_4": msg4,
+            "T_topic_10_0__F_msg_2": msg2,
+        }
+    )
+    ulogconv.apply_zoh(df, [TopicMsgs("topic_1", ["msg_2"])])
+    assert_almost_equal(msg_2_expected, df.T_topic_1_0__F_msg_2)
+    assert_almost_equal(msg4, df.T_topic_1_0__F_msg_4)
+    assert_almost_equal(msg2, df.T_topic_10_0__F_msg_2)
+
+
+def test_column_index():
+    """test lookup of columns by topic, instance and field."""
+    columns = [
+        "timestamp",
+        "T_topic_1_0__F_x",
+        "T_topic_1_0__F_q_0",
+        "T_topic_1_0__F_q_1",
+        "T_topic_1_1__F_x",
+        "T_topic_1_1__F_q_0",
+        "T_topic_10_0__F_x",
+    ]
+    index = ulogconv.ColumnIndex(columns)
+
+    assert index.instances("topic_1") == [0, 1]
+    assert index.instances("topic_2") == []
+    assert index.positions("topic_1") == [1, 2, 3, 4, 5]
+    assert index.positions("topic_1", instance=1) == [4, 5]
+    assert index.positions("topic_1", ["x"]) == [1, 4]
+    assert index.positions("topic_1", ["q[1]"], instance=0) == [3]
+    assert index.positions("topic_1", ["q_1"], instance=0) == [3]
+    assert index.positions("topic_1", ["q"], instance=0) == [2, 3]
+    assert index.positions("topic_1", ["y"]) == []
+    assert index.names("topic_10") == ["T_topic_10_0__F_x"]
+    assert index.groups() == [[1, 2, 3], [4, 5], [6]]
+
 
 def test_replace_nan_with_inf():
     """test replace nan with inf."""
@@ -116,3 +174,245 @@ def test_replace_nan_with_inf():
     ulogconv.replace_nan_with_inf(ulog, topic_msgs_list)
     assert_almost_equal(ulog.data_list[0].data["fake_msg_0"], inf_msg)
     assert_almost_equal(ulog.data_list[1].data["fake_msg_0"], inf_msg)
+
+
+def _merge_pandadict_ordered(pandadict):
+    """Merge topics one at a time with pd.merge_ordered."""
+    ulogconv.combine_topic_fieldname(pandadict)
+    m = None
+    for topic in pandadict:
+        df = pandadict[topic].reset_index(drop=True)
+        if m is None:
+            m = df
+        else:
+            m = pd.merge_ordered(m, df, on="timestamp", how="outer")
+    return m
+
+
+def _synthetic_pandadict(ntopics, nsamples=2000, nfields=10, seed=0):
+    """Create a dictionary of topics with random, partially shared timestamps."""
+    rng = np.random.RandomState(seed)
+    pandadict = {}
+    for i in range(ntopics):
+        ts = np.unique(rng.randint(0, 10 * nsamples, nsamples)) * 1000
+        data = {"timestamp": ts.astype(np.uint64)}
+        for j in range(nfields):
+            data["F_field_{:d}".format(j)] = rng.randn(ts.shape[0])
+        pandadict["T_topic_{:d}_0".format(i)] = pd.DataFrame(data)
+    return pandadict
+
+
+def test_merge_pandadict():
+    """test merge against the sequential merge_ordered."""
+    file = "testlogs/position.ulg"
+    topics = [
+        "vehicle_local_position",
+        "vehicle_attitude",
+        "vehicle_status",
+        "sensor_combined",
+    ]
+    ulog = pyulog.ULog(file, topics)
+
+    df = ulogconv.merge_pandadict(ulogconv.create_pandadict(ulog))
+    expected = _merge_pandadict_ordered(ulogconv.create_pandadict(ulog))
+
+    assert df.timestamp.is_monotonic_increasing
+    assert df.shape == expected.shape
+    assert set(df.columns) == set(expected.columns)
+    assert_almost_equal(df.timestamp.values, expected.timestamp.values)
+    for col in expected.columns:
+        assert_almost_equal(
+            df[col].values, expected[col].values.astype(np.float64)
+        )
+    assert_almost_equal(
+        df.index.total_seconds() * 1e6, df.timestamp.values.astype(np.float64)
+    )
+
+
+def test_merge_pandadict_benchmark():
+    """compare sequential and single-pass merge as topic count grows."""
+    for ntopics in (5, 10, 20, 40):
+        pandadict = _synthetic_pandadict(ntopics)
+        start = time.perf_counter()
+        _merge_pandadict_ordered(pandadict)
+        ordered = time.perf_counter() - start
+
+        pandadict = _synthetic_pandadict(ntopics)
+        start = time.perf_counter()
+        ulogconv.merge_pandadict(pandadict)
+        single_pass = time.perf_counter() - start
+
+        print(
+            "merge {:d} topics: {:.3f}s -> {:.3f}s ({:.1f}x)".format(
+                ntopics, ordered, single_pass, ordered / single_pass
+            )
+        )
+    assert single_pass < ordered
+
+
+def test_interpolate():
+    """test linear and zero-order-hold interpolation kernels."""
+    ts = np.array([10, 20, 40], dtype=np.uint64)
+    values = np.array([0, 1, np.nan], dtype=np.float32)
+    timestamps = np.array([0, 10, 15, 20, 30, 50], dtype=np.uint64)
+
+    linear = ulogconv.interpolate_linear(ts[:2], values[:2], timestamps)
+    assert_almost_equal(linear, [np.nan, 0, 0.5, 1, 1, 1])
+
+    zoh = ulogconv.interpolate_zoh(ts, values, timestamps)
+    assert_almost_equal(zoh, [np.nan, 0, 0, 1, 1, np.nan])
+
+
+def test_resample_pandadict():
+    """test resampling of topics onto a uniform grid."""
+    pandadict = {
+        "T_topic_1_0": pd.DataFrame(
+            {
+                "timestamp": np.array([0, 1000, 2000], dtype=np.uint64),
+                "F_msg_1": [0.0, 1.0, 2.0],
+                "F_msg_2": [0.0, 1.0, 2.0],
+            }
+        ),
+        "T_topic_2_0": pd.DataFrame(
+            {
+                "timestamp": np.array([500, 2500], dtype=np.uint64),
+                "F_msg_1": [5, 7],
+            }
+        ),
+    }
+    grid = ulogconv.create_grid(pandadict, 2000)
+    assert_almost_equal(grid, [0, 500, 1000, 1500, 2000, 2500])
+
+    df = ulogconv.resample_pandadict(
+        pandadict, grid, [TopicMsgs("topic_1", ["msg_2"])]
+    )
+    assert list(df.columns) == [
+        "timestamp",
+        "T_topic_1_0__F_msg_1",
+        "T_topic_1_0__F_msg_2",
+        "T_topic_2_0__F_msg_1",
+    ]
+    assert_almost_equal(df.T_topic_1_0__F_msg_1, [0, 0.5, 1, 1.5, 2, 2])
+    assert_almost_equal(df.T_topic_1_0__F_msg_2, [0, 0, 1, 1, 2, 2])
+    assert_almost_equal(df.T_topic_2_0__F_msg_1, [np.nan, 5, 5.5, 6, 6.5, 7])
+
+
+def test_resample_pandadict_zoh_array():
+    """test that zero-order-hold msgs select all elements of an array."""
+    pandadict = {
+        "T_topic_1_0": pd.DataFrame(
+            {
+                "timestamp": np.array([0, 1000], dtype=np.uint64),
+                "F_q_0": [0.0, 1.0],
+                "F_q_1": [0.0, 1.0],
+                "F_x": [0.0, 1.0],
+            }
+        )
+    }
+    df = ulogconv.resample_pandadict(
+        pandadict, [0, 500, 1000], [TopicMsgs("topic_1", ["q"])]
+    )
+    assert_almost_equal(df.T_topic_1_0__F_q_0, [0, 0, 1])
+    assert_almost_equal(df.T_topic_1_0__F_q_1, [0, 0, 1])
+    assert_almost_equal(df.T_topic_1_0__F_x, [0, 0.5, 1])
+
+
+def test_interpolate_pandaframe():
+    """test interpolation of a merged dataframe against pandas."""
+    msg1 = [np.nan, 1, np.nan, np.nan, 4, np.inf, np.nan, 7, np.nan, np.nan]
+    msg2 = [np.nan, np.nan, np.nan, np.nan, np.nan, 1, 2, 3, 4, 5]
+    msg3 = [np.nan] * 10
+    df = pd.DataFrame(
+        {
+            "timestamp": np.arange(10, dtype=np.uint64),
+            "T_topic_1_0__F_msg_1": msg1,
+            "T_topic_1_0__F_msg_2": msg2,
+            "T_topic_2_0__F_msg_1": msg3,
+        }
+    )
+    expected = df.interpolate()
+    ulogconv.interpolate_pandaframe(df, workers=2)
+    np.testing.assert_array_equal(df.values, expected.values)
+
+
+def test_merge_pandadict_interpolate():
+    """test filling of merge gaps, nan-values of the log are kept."""
+    pandadict = {
+        "T_topic_1_0": pd.DataFrame(
+            {
+                "timestamp": np.array([0, 30, 40, 50], dtype=np.uint64),
+                "F_msg_1": [0.0, 3.0, np.nan, 5.0],
+                "F_msg_2": [0.0, 3.0, np.nan, 5.0],
+            }
+        ),
+        "T_topic_2_0": pd.DataFrame(
+            {
+                "timestamp": np.array([10, 20, 45, 60], dtype=np.uint64),
+                "F_msg_1": np.array([1, 2, 4, 6], dtype=np.int32),
+            }
+        ),
+    }
+    df = ulogconv.merge_pandadict(
+        pandadict,
+        interpolate=True,
+        zoh_topic_msgs_list=[TopicMsgs("topic_1", ["msg_2"])],
+    )
+    assert_almost_equal(df.timestamp, [0, 10, 20, 30, 40, 45, 50, 60])
+    assert_almost_equal(
+        df.T_topic_1_0__F_msg_1, [0, 1, 2, 3, np.nan, np.nan, 5, 5]
+    )
+    assert_almost_equal(
+        df.T_topic_1_0__F_msg_2, [0, 0, 0, 3, np.nan, np.nan, 5, 5]
+    )
+    assert_almost_equal(
+        df.T_topic_2_0__F_msg_1, [np.nan, 1, 2, 8 / 3, 10 / 3, 4, 5, 6]
+    )
+
+    # same as interpolating the merged dataframe if the log has no nan
+    pandadict = _synthetic_pandadict(5)
+    df = ulogconv.merge_pandadict(pandadict, interpolate=True)
+    expected = ulogconv.merge_pandadict(_synthetic_pandadict(5))
+    ulogconv.interpolate_pandaframe(expected)
+    np.testing.assert_array_equal(df.values, expected.values)
+
+
+def test_merge_pandadict_compact():
+    """test that compact merge and resample keep the field dtypes."""
+
+    def pandadict():
+        return {
+            "T_topic_1_0": pd.DataFrame(
+                {
+                    "timestamp": np.array([0, 30, 50], dtype=np.uint64),
+                    "F_msg_1": np.array([0, 3, 5], dtype=np.float32),
+                }
+            ),
+            "T_topic_2_0": pd.DataFrame(
+                {
+                    "timestamp": np.array([10, 20, 40], dtype=np.uint64),
+                    "F_flag": np.array([1, 2, 4], dtype=np.uint8),
+                    "F_armed": np.array([True, False, True]),
+                }
+            ),
+        }
+
+    df = ulogconv.merge_pandadict(pandadict(), interpolate=True, compact=True)
+    assert df.T_topic_1_0__F_msg_1.dtype == np.float32
+    assert df.T_topic_2_0__F_flag.dtype == pd.UInt8Dtype()
+    assert df.T_topic_2_0__F_armed.dtype == pd.BooleanDtype()
+    assert_almost_equal(df.T_topic_1_0__F_msg_1, [0, 1, 2, 3, 4, 5], decimal=6)
+    assert df.T_topic_2_0__F_flag.tolist() == [pd.NA, 1, 2, 2, 4, 4]
+    assert df.T_topic_2_0__F_armed.tolist() == [
+        pd.NA,
+        True,
+        False,
+        False,
+        True,
+        True,
+    ]
+
+    grid = np.array([0, 25, 50], dtype=np.uint64)
+    df = ulogconv.resample_pandadict(pandadict(), grid, compact=True)
+    assert df.T_topic_1_0__F_msg_1.dtype == np.float32
+    assert_almost_equal(df.T_topic_1_0__F_msg_1, [0, 2.5, 5])
+    assert df.T_topic_2_0__F_flag.tolist() == [pd.NA, 2, 4]
@@ -1,6 +1,10 @@
 """test_dfUlg."""
 from context import DfUlg
+from context import TopicMsgs
+import numpy as np
+import pandas as pd
 import pytest
+from numpy.testing import assert_almost_equal
 
 
 def test_file_does_not_exist():
@@ -21,3 +25,390 @@ def test_existing_file():
     """test for file that exists."""
     file = "testlogs/position.ulg"
     DfUlg._check_file(file)
+
+
+def test_get_columns():
+    """test lookup of dataframe columns."""
+    file = "testlogs/position.ulg"
+    lm = DfUlg.create(file, topics=["vehicle_attitude"])
+    assert lm.get_columns("vehicle_attitude", ["q"]) == [
+        "T_vehicle_attitude_0__F_q_{:d}".format(i) for i in range(4)
+    ]
+    assert lm.get_columns("vehicle_attitude", ["q[2]"]) == [
+        "T_vehicle_attitude_0__F_q_2"
+    ]
+
+    # the index follows new columns
+    lm.df["T_vehicle_attitude_0__F_new"] = 0
+    assert lm.get_columns("vehicle_attitude", ["new"]) == [
+        "T_vehicle_attitude_0__F_new"
+    ]
+
+
+def test_create_rate_hz():
+    """test resampling onto a uniform grid."""
+    file = "testlogs/position.ulg"
+    topics = ["vehicle_attitude", "vehicle_status"]
+    lm = DfUlg.create(
+        file,
+        topics=topics,
+        zoh_topic_msgs_list=[TopicMsgs("vehicle_status", [])],
+        rate_hz=10,
+    )
+
+    assert_almost_equal(np.diff(lm.df.timestamp.values), 100000)
+    assert_almost_equal(np.diff(lm.df.timestamp_s.values), 0.1)
+
+    att = lm.ulog.get_dataset("vehicle_attitude").data
+    expected = np.interp(
+        lm.df.timestamp.values.astype(np.float64),
+        att["timestamp"].astype(np.float64),
+        att["q[0]"],
+        left=np.nan,
+    )
+    assert_almost_equal(lm.df.T_vehicle_attitude_0__F_q_0.values, expected)
+
+    # zero-order-hold only takes values that are in the log
+    status = lm.ulog.get_dataset("vehicle_status").data
+    values = lm.df.T_vehicle_status_0__F_nav_state.dropna().unique()
+    assert set(values) <= set(status["nav_state"])
+
+
+def test_create_grid():
+    """test resampling onto a given grid."""
+    file = "testlogs/position.ulg"
+    grid = np.arange(2000000, 3000000, 250000)
+    lm = DfUlg.create(file, topics=["vehicle_attitude"], grid=grid)
+    assert_almost_equal(lm.df.timestamp.values, grid)
+
+    with pytest.raises(Exception):
+        DfUlg.create(file, topics=["vehicle_attitude"], grid=grid, rate_hz=10)
+
+
+def test_create_chunks():
+    """test that chunks are identical to the complete dataframe."""
+    file = "testlogs/position.ulg"
+    topics = ["vehicle_attitude", "vehicle_status", "vehicle_gps_position"]
+    zoh = [TopicMsgs("vehicle_status", [])]
+    lm = DfUlg.create(file, topics=topics, zoh_topic_msgs_list=zoh, rate_hz=7)
+
+    chunks = list(
+        DfUlg.create_chunks(
+            file, topics=topics, zoh_topic_msgs_list=zoh, rate_hz=7, chunk_s=5
+        )
+    )
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.timestamp.iloc[-1] - chunk.timestamp.iloc[0] < 5e6
+
+    df = pd.concat(chunks)
+    assert list(df.columns) == list(lm.df.columns)
+    assert_almost_equal(df.values, lm.df.values)
+
+    # union of all timestamps
+    lm = DfUlg.create(file, topics=topics, zoh_topic_msgs_list=zoh)
+    chunks = list(
+        DfUlg.create_chunks(
+            file, topics=topics, zoh_topic_msgs_list=zoh, chunk_s=5
+        )
+    )
+    assert len(chunks) > 1
+    df = pd.concat(chunks)
+    assert list(df.columns) == list(lm.df.columns)
+    assert_almost_equal(df.values, lm.df.values)
+
+    with pytest.raises(Exception):
+        next(DfUlg.create_chunks(file, topics=topics, rate_hz=7, grid=[0]))
+
+
+def test_create_many():
+    """test parallel creation of many DfUlg objects."""
+    files = [
+        "testlogs/position.ulg",
+        "testlogs/no_ulg.txt",
+        "testlogs/parameterchange.ulg",
+        "mickeymouse_file.ulg",
+    ]
+    topics = ["vehicle_local_position", "vehicle_attitude"]
+    results = list(
+        DfUlg.create_many(files, topics=topics, workers=2, rate_hz=20)
+    )
+
+    assert sorted(r.filepath for r in results) == sorted(files)
+    for result in results:
+        if result.filepath in files[::2]:
+            assert result.error is None
+            expected = DfUlg.create(result.filepath, topics=topics, rate_hz=20)
+            assert list(result.dfulg.df.columns) == list(expected.df.columns)
+            assert result.dfulg.df.index.equals(expected.df.index)
+            assert_almost_equal(result.dfulg.df.values, expected.df.values)
+            assert result.dfulg.topics == topics
+            assert (
+                result.dfulg.ulog.initial_parameters
+                == expected.ulog.initial_parameters
+            )
+        else:
+            assert result.dfulg is None
+            assert isinstance(result.error, Exception)
+
+
+def test_create_workers():
+    """test that concurrent conversion is identical to serial conversion."""
+    file = "testlogs/parameterchange.ulg"
+    topics = [
+        "vehicle_local_position",
+        "vehicle_attitude",
+        "vehicle_status",
+        "vehicle_local_position_setpoint",
+    ]
+    kwargs = dict(
+        topics=topics,
+        zoh_topic_msgs_list=[TopicMsgs("vehicle_status", [])],
+        nan_topic_msgs_list=[
+            TopicMsgs("vehicle_local_position_setpoint", ["x", "y", "z"])
+        ],
+    )
+    for grid_kwargs in ({}, {"rate_hz": 20}):
+        serial = DfUlg.create(file, **kwargs, **grid_kwargs)
+        concurrent = DfUlg.create(file, workers=4, **kwargs, **grid_kwargs)
+        assert list(serial.df.columns) == list(concurrent.df.columns)
+        assert serial.df.index.equals(concurrent.df.index)
+        np.testing.assert_array_equal(serial.df.values, concurrent.df.values)
+
+
+def test_create_keeps_nan():
+    """test that nan-values of the log are kept and the ulog is untouched."""
+    file = "testlogs/position.ulg"
+    topics = ["actuator_outputs", "vehicle_attitude"]
+    lm = DfUlg.create(
+        file,
+        topics=topics,
+        nan_topic_msgs_list=[TopicMsgs("actuator_outputs", [])],
+    )
+    data = lm.ulog.get_dataset("actuator_outputs").data
+    assert np.isnan(data["output[15]"]).any()
+    assert not np.isinf(data["output[15]"]).any()
+
+    # the samples of the log are unchanged, including nan-values
+    samples = lm.df.timestamp.isin(data["timestamp"])
+    assert_almost_equal(
+        lm.df.loc[samples, "T_actuator_outputs_0__F_output_15"].values,
+        data["output[15]"],
+    )
+
+
+def test_create_compact():
+    """test that compact dataframes keep the ulog dtypes and save memory."""
+    file = "testlogs/position.ulg"
+    kwargs = dict(
+        topics=["vehicle_attitude", "vehicle_status"],
+        zoh_topic_msgs_list=[
+            TopicMsgs("vehicle_status", []),
+            TopicMsgs("vehicle_attitude", ["q"]),
+        ],
+    )
+    for grid_kwargs in ({}, {"rate_hz": 20}):
+        lm = DfUlg.create(file, **kwargs, **grid_kwargs)
+        compact = DfUlg.create(file, compact=True, **kwargs, **grid_kwargs)
+
+        assert list(lm.df.columns) == list(compact.df.columns)
+        assert compact.df.T_vehicle_attitude_0__F_q_0.dtype == np.float32
+        assert compact.df.T_vehicle_status_0__F_arming_state.dtype.kind in "iu"
+        assert_almost_equal(
+            compact.df.T_vehicle_attitude_0__F_q_0.values,
+            lm.df.T_vehicle_attitude_0__F_q_0.values,
+            decimal=6,
+        )
+        assert_almost_equal(
+            compact.df.T_vehicle_status_0__F_arming_state.to_numpy(
+                dtype=np.float64, na_value=np.nan
+            ),
+            lm.df.T_vehicle_status_0__F_arming_state.values,
+        )
+
+        usage = compact.memory_usage()
+        assert usage["float64_bytes"] == lm.memory_usage()["bytes"]
+        assert usage["saved_bytes"] > usage["float64_bytes"] / 3
+
+
+def test_create_lazy():
+    """test that lazy columns are identical to the merged dataframe."""
+    file = "testlogs/position.ulg"
+    kwargs = dict(
+        topics=["vehicle_attitude", "vehicle_status"],
+        zoh_topic_msgs_list=[
+            TopicMsgs("vehicle_status", []),
+            TopicMsgs("vehicle_attitude", ["q"]),
+        ],
+    )
+    for grid_kwargs in ({}, {"rate_hz": 20}, {"compact": True}):
+        lm = DfUlg.create(file, **kwargs, **grid_kwargs)
+        lazy = DfUlg.create(file, lazy=True, **kwargs, **grid_kwargs)
+
+        assert list(lazy.df.columns) == list(lm.df.columns)
+        assert lazy.df.shape == lm.df.shape
+        assert lazy.df.materialized == ["timestamp", "timestamp_s"]
+
+        q0 = lazy.df["T_vehicle_attitude_0__F_q_0"]
+        assert q0.equals(lm.df["T_vehicle_attitude_0__F_q_0"])
+        assert lazy.df["T_vehicle_attitude_0__F_q_0"] is q0
+        assert lazy.df.T_vehicle_status_0__F_nav_state.equals(
+            lm.df.T_vehicle_status_0__F_nav_state
+        )
+        assert len(lazy.df.materialized) == 4
+
+        assert lazy.df.to_frame().equals(lm.df)
+
+    lazy.df["new"] = 1
+    assert "new" in lazy.df
+    assert (lazy.df.new == 1).all()
+    with pytest.raises(KeyError):
+        lazy.df["T_vehicle_attitude_0__F_nonexisting"]
+
+
+def test_create_projection():
+    """test that only the selected msgs are converted."""
+    file = "testlogs/position.ulg"
+    lm = DfUlg.create(file, topics=["vehicle_attitude", "vehicle_status"])
+    projected = DfUlg.create(
+        file,
+        topics=[
+            TopicMsgs("vehicle_attitude", ["q[0]", "q_1"]),
+            TopicMsgs("vehicle_status", ["nav_state"]),
+        ],
+    )
+    columns = [
+        "timestamp",
+        "T_vehicle_attitude_0__F_q_0",
+        "T_vehicle_attitude_0__F_q_1",
+        "T_vehicle_status_0__F_nav_state",
+        "timestamp_s",
+    ]
+    assert list(projected.df.columns) == columns
+    assert projected.df.equals(lm.df[columns])
+
+
+def test_create_window():
+    """test that a time window equals the same rows of the whole log."""
+    file = "testlogs/position.ulg"
+    kwargs = dict(
+        topics=["vehicle_attitude", "vehicle_status", "vehicle_gps_position"],
+        zoh_topic_msgs_list=[TopicMsgs("vehicle_status", [])],
+    )
+    lm = DfUlg.create(file, **kwargs)
+    n = lm.df.shape[0]
+    start = int(lm.df.timestamp.iloc[n // 4]) + 1
+    end = int(lm.df.timestamp.iloc[n // 2])
+    for window_kwargs in ({}, {"lazy": True}, {"compact": True}):
+        full = DfUlg.create(file, **kwargs, **window_kwargs).df
+        window = DfUlg.create(
+            file, start_us=start, end_us=end, **kwargs, **window_kwargs
+        ).df
+        if window_kwargs.get("lazy"):
+            full = full.to_frame()
+            window = window.to_frame()
+        rows = (full.timestamp >= start) & (full.timestamp <= end)
+        assert window.timestamp.iloc[0] >= start
+        assert window.timestamp.iloc[-1] == end
+        assert_almost_equal(window.timestamp_s.iloc[0], 0)
+        assert window.drop(columns="timestamp_s").equals(
+            full[rows].drop(columns="timestamp_s")
+        )
+
+    # relative to the start of the log
+    ulog_start = lm.ulog.start_timestamp
+    window = DfUlg.create(
+        file, start_s=(start - ulog_start) * 1e-6, end_us=end, **kwargs
+    )
+    assert window.df.timestamp.iloc[0] >= start
+
+    # a grid starts at the beginning of the window
+    grid = DfUlg.create(file, rate_hz=10, **kwargs)
+    window = DfUlg.create(
+        file, rate_hz=10, start_us=start, end_us=end, **kwargs
+    )
+    assert window.df.timestamp.iloc[0] == start
+    assert window.df.timestamp.iloc[-1] <= end
+    window = DfUlg.create(
+        file,
+        grid=grid.df.timestamp.values,
+        start_us=start,
+        end_us=end,
+        **kwargs
+    )
+    rows = (grid.df.timestamp >= start) & (grid.df.timestamp <= end)
+    assert_almost_equal(
+        window.df.drop(columns="timestamp_s").values,
+        grid.df[rows].drop(columns="timestamp_s").values,
+    )
+
+    with pytest.raises(Exception):
+        DfUlg.create(file, start_us=end, end_us=start, **kwargs)
+
+
+def test_save_load(tmpdir):
+    """test that a stored DfUlg is restored with dtypes and metadata."""
+    pq = pytest.importorskip("pyarrow.parquet")
+    file = "testlogs/position.ulg"
+    topics = [TopicMsgs("vehicle_attitude", ["q"]), "vehicle_local_position"]
+    dfulg = DfUlg.create(file, topics=topics, compact=True)
+
+    path = dfulg.save(str(tmpdir), log_id="position", row_group_s=10)
+    assert path.endswith("log_id=position/part-0.parquet")
+    duration_s = (
+        dfulg.df.timestamp.iloc[-1] - dfulg.df.timestamp.iloc[0]
+    ) * 1e-6
+    assert pq.ParquetFile(path).num_row_groups == int(duration_s // 10) + 1
+
+    loaded = DfUlg.load(str(tmpdir), log_id="position")
+    pd.testing.assert_frame_equal(loaded.df, dfulg.df)
+    assert loaded.topics[0].topic == "vehicle_attitude"
+    assert loaded.topics[0].msgs == ["q"]
+    assert loaded.topics[1] == "vehicle_local_position"
+    assert loaded.ulog.start_timestamp == dfulg.ulog.start_timestamp
+    assert loaded.ulog.initial_parameters == dfulg.ulog.initial_parameters
+
+    # read only some columns and a time range
+    columns = dfulg.get_columns("vehicle_attitude", ["q"])
+    start = dfulg.df.timestamp.iloc[len(dfulg.df) // 4]
+    end = dfulg.df.timestamp.iloc[len(dfulg.df) // 2]
+    loaded = DfUlg.load(path, columns=columns, start_us=start, end_us=end)
+    assert list(loaded.df.columns) == ["timestamp"] + columns
+    expected = dfulg.df[
+        (dfulg.df.timestamp >= start) & (dfulg.df.timestamp <= end)
+    ]
+    pd.testing.assert_frame_equal(
+        loaded.df.reset_index(drop=True),
+        expected[["timestamp"] + columns].reset_index(drop=True),
+        check_index_type=False,
+    )
+
+
+def test_create_stats():
+    """test the statistics of the stages of create."""
+    file = "testlogs/position.ulg"
+    topics = ["vehicle_local_position", "vehicle_attitude"]
+    reported = []
+    dfulg = DfUlg.create(file, topics=topics, callback=reported.append)
+    assert reported == dfulg.stats
+    assert [s.stage for s in dfulg.stats] == [
+        "read_ulog",
+        "create_pandadict",
+        "merge_pandadict",
+        "timestamp_s",
+    ]
+    merge = dfulg.stats[2]
+    assert merge.rows == len(dfulg.df)
+    assert merge.columns == len(dfulg.df.columns) - 1
+    assert merge.bytes > 0 and merge.time_s > 0
+
+    dfulg = DfUlg.create(file, topics=topics, rate_hz=10, lazy=True)
+    stats = pd.DataFrame(dfulg.stats).set_index("stage")
+    assert list(stats.index) == [
+        "read_ulog",
+        "create_pandadict",
+        "create_grid",
+        "lazy_frame",
+        "timestamp_s",
+    ]
+    assert stats.loc["create_grid", "rows"] == len(dfulg.df)
@@ -0,0 +1,53 @@
+"""test_ulogindex."""
+from context import ulogindex
+import os
+import shutil
+
+
+def test_index(tmp_path):
+    """test incremental updates and queries of the index."""
+    logs = tmp_path / "logs"
+    os.makedirs(str(logs / "sub"))
+    shutil.copy("testlogs/position.ulg", str(logs))
+    shutil.copy("testlogs/parameterchange.ulg", str(logs / "sub"))
+    position = os.path.abspath(str(logs / "position.ulg"))
+    parameterchange = os.path.abspath(
+        str(logs / "sub" / "parameterchange.ulg")
+    )
+
+    index = ulogindex.ULogIndex(str(tmp_path / "index.db"))
+    updated, errors = index.update(str(logs))
+    assert sorted(updated) == sorted([position, parameterchange])
+    assert not errors
+    assert len(index) == 2
+
+    # unchanged logs are not read again
+    assert index.update(str(logs)) == ([], {})
+
+    topics = index.topics(position)
+    assert topics["vehicle_local_position"][0] == 1
+    assert topics["vehicle_local_position"][1] > 0
+
+    assert index.query() == sorted([position, parameterchange])
+    assert index.query(min_duration_s=63) == [parameterchange]
+    assert index.query(
+        topics=["vehicle_local_position"], params={"MPC_XY_P": ("<", 0.9)}
+    ) == [position]
+    assert index.query(
+        params={"MPC_XY_P": (">", 0.9), "MPC_TILTMAX_AIR": (">", 35)}
+    ) == [parameterchange]
+    assert index.query(topics=["vv"]) == []
+
+    # changed logs are read again, removed logs are removed
+    os.utime(position, ns=(0, 0))
+    os.remove(parameterchange)
+    assert index.update(str(logs)) == ([position], {})
+    assert index.query() == [position]
+
+    # files that are not ulogs are reported
+    with open(str(logs / "broken.ulg"), "wb") as f:
+        f.write(b"no ulog")
+    updated, errors = index.update(str(logs))
+    assert list(errors) == [os.path.abspath(str(logs / "broken.ulg"))]
+    assert len(index) == 1
+    index.close()
@@ -0,0 +1,106 @@
+"""test_ulogsynth."""
+from context import ulogsynth
+from context import DfUlg
+import numpy as np
+import os
+import pyulog
+import pytest
+
+
+def _assert_same_ulog(ulog, parsed):
+    """Assert that parsed contains the topics and parameters of ulog."""
+    assert parsed.start_timestamp == ulog.start_timestamp
+    assert parsed.last_timestamp == ulog.last_timestamp
+    assert parsed.initial_parameters == ulog.initial_parameters
+    assert parsed.changed_parameters == ulog.changed_parameters
+    assert len(parsed.data_list) == len(ulog.data_list)
+    for msg in ulog.data_list:
+        parsed_msg = parsed.get_dataset(msg.name, msg.multi_id)
+        assert sorted(msg.data) == sorted(parsed_msg.data)
+        for field, values in msg.data.items():
+            assert values.dtype == parsed_msg.data[field].dtype
+            np.testing.assert_array_equal(values, parsed_msg.data[field])
+
+
+def test_write_generated(tmpdir):
+    """test that pyulog parses the generated log."""
+    topics = [
+        ulogsynth.TopicSpec("vehicle_attitude", 250),
+        ulogsynth.TopicSpec(
+            "sensor_gps",
+            10,
+            [("double", "lat"), ("bool", "valid"), ("int16_t[3]", "c")],
+            instances=2,
+        ),
+    ]
+    kwargs = dict(nan_density=0.1, dropouts=3, parameter_changes=5)
+    ulog = ulogsynth.generate(topics, 5, seed=3, **kwargs)
+    file = os.path.join(str(tmpdir), "synthetic.ulg")
+    ulogsynth.write_ulog(file, ulog)
+    parsed = pyulog.ULog(file)
+    _assert_same_ulog(ulog, parsed)
+    assert [(d.timestamp, d.duration) for d in parsed.dropouts] == [
+        tuple(d) for d in ulog.dropouts
+    ]
+    assert len(ulog.dropouts) > 0
+
+    # deterministic for a seed
+    again = ulogsynth.generate(topics, 5, seed=3, **kwargs)
+    _assert_same_ulog(ulog, again)
+
+    q = ulog.get_dataset("vehicle_attitude").data
+    nan = np.isnan(q["x"])
+    assert 0.05 < nan.mean() < 0.15
+    norm = np.sqrt(sum(q["q[{:d}]".format(i)] ** 2 for i in range(4)))
+    np.testing.assert_allclose(norm[~np.isnan(norm)], 1, rtol=1e-5)
+    assert DfUlg.create(file, topics=["sensor_gps"]).df.shape[0] > 0
+
+
+def test_write_parsed(tmpdir):
+    """test that a parsed log is written without changes."""
+    ulog = pyulog.ULog("testlogs/parameterchange.ulg")
+    file = os.path.join(str(tmpdir), "copy.ulg")
+    ulogsynth.write_ulog(file, ulog)
+    _assert_same_ulog(ulog, pyulog.ULog(file))
+
+
+def test_write_nested(tmpdir):
+    """test a topic with a nested array of structs."""
+    formats = {
+        "esc_report": [("int32_t", "esc_rpm"), ("float", "esc_voltage")],
+        "esc_status": [
+            ("uint64_t", "timestamp"),
+            ("esc_report[2]", "esc"),
+            ("uint8_t[4]", "_padding0"),
+        ],
+    }
+    n = 10
+    data = {"timestamp": np.arange(1, n + 1, dtype=np.uint64) * 1000}
+    for i in range(2):
+        data["esc[{:d}].esc_rpm".format(i)] = np.arange(n, dtype=np.int32)
+        data["esc[{:d}].esc_voltage".format(i)] = np.linspace(
+            10, 12, n, dtype=np.float32
+        )
+    meta = {
+        "start_timestamp": 0,
+        "last_timestamp": n * 1000,
+        "initial_parameters": {},
+        "changed_parameters": [],
+        "msg_info_dict": {},
+    }
+    data_list = [ulogsynth.ulogcache.CachedData("esc_status", 0, data)]
+    ulog = ulogsynth.SyntheticULog(meta, data_list, formats, [])
+    file = os.path.join(str(tmpdir), "nested.ulg")
+    ulogsynth.write_ulog(file, ulog)
+    parsed = pyulog.ULog(file)
+    _assert_same_ulog(ulog, parsed)
+
+    # the layout of a parsed log is taken from its message formats
+    copy = os.path.join(str(tmpdir), "copy.ulg")
+    ulogsynth.write_ulog(copy, parsed)
+    _assert_same_ulog(parsed, pyulog.ULog(copy))
+
+    # without message formats, nested fields cannot be written
+    cached = ulogsynth.ulogcache.CachedULog(meta, data_list)
+    with pytest.raises(Exception):
+        ulogsynth.write_ulog(copy, cached)